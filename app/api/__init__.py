@@ -1,9 +1,23 @@
 from typing import Annotated
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
 
 from app.core.security import get_current_user
 from app.db import models
 
 CurrentUserDependency = Annotated[models.User, Depends(get_current_user)]
 UserDependency: models.User = Depends(get_current_user)
+
+
+def require_seller(user: CurrentUserDependency) -> models.User:
+    """Returns the current user, raising a 403 error for non-sellers."""
+    if user.role != "seller":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorized to perform this action.",
+        )
+
+    return user
+
+
+SellerDependency = Annotated[models.User, Depends(require_seller)]
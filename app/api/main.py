@@ -4,6 +4,9 @@ from app.api.routes import orders, products, users, auth
 
 api_router = APIRouter(prefix="/api/v1")
 
+api_router.include_router(
+    users.public_router, prefix="/users", tags=["users"]
+)
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(
     products.router, prefix="/products", tags=["products"]
@@ -1,16 +1,21 @@
+from functools import partial
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from anyio import to_thread
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import select
-from app import schemas
-from app.db import models
+from app import schemas, utils
 from app.core.deps import DBSessionDependency
-from app.core.settings import settings
 from app.core import security
+from app.crud.users import USER_BY_EMAIL_QUERY
 
 router = APIRouter()
 
+invalid_credentials_exception = HTTPException(
+    detail="Invalid credentials",
+    status_code=status.HTTP_417_EXPECTATION_FAILED,
+)
+
 
 @router.post(
     "/login",
@@ -20,34 +25,44 @@ router = APIRouter()
 async def login(
     user_credentials: Annotated[OAuth2PasswordRequestForm, Depends()],
     db: DBSessionDependency,
+    background_tasks: BackgroundTasks,
 ) -> schemas.Token:
-    invalid_credentials_exception = HTTPException(
-        detail="Invalid credentials",
-        status_code=status.HTTP_417_EXPECTATION_FAILED,
-    )
+    user = (
+        await db.exec(
+            USER_BY_EMAIL_QUERY, params={"email": user_credentials.username}
+        )
+    ).first()
 
-    query = select(models.User).where(
-        models.User.email == user_credentials.username
+    # bcrypt is slow on purpose, keep it off the event loop
+    is_valid_password = await to_thread.run_sync(
+        partial(
+            security.is_valid_password,
+            plain_password=user_credentials.password,
+            hashed_password=user.password if user else None,
+        ),
+        limiter=utils.get_password_limiter(),
     )
-    user = db.exec(query).first()
-
-    if not user:
+    if not user or not is_valid_password:
         raise invalid_credentials_exception
 
-    if not security.is_valid_password(
-        plain_password=user_credentials.password,
-        hashed_password=user.password,
-    ):
-        raise invalid_credentials_exception
+    # hashes made with another cost are replaced once the response is sent
+    if utils.password_needs_rehash(user.password):
+        background_tasks.add_task(
+            security.rehash_password,
+            user_id=user.user_id,
+            plain_password=user_credentials.password,
+            hashed_password=user.password,
+        )
 
-    access_token = security.create_access_token(
+    access_token, expires = security.create_access_token(
         data={"sub": str(user.user_id), "email": user.email}
     )
 
+    # every field is already trusted here, skip validating them again
     return {
-        "data": schemas.TokenBase(
+        "data": schemas.TokenBase.model_construct(
             access_token=access_token,
             token_type="bearer",
-            expires=settings.access_token_duration,
+            expires=expires,
         )
     }
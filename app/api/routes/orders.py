@@ -1,10 +1,17 @@
 from uuid import UUID
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, BackgroundTasks, status
+from fastapi.responses import ORJSONResponse
 
 from app import schemas
 from app.api import CurrentUserDependency, UserDependency
-from app.core.deps import DBSessionDependency, PaginationLimitDependency
+from app.core.cache import clear_product_cache
+from app.core.deps import (
+    DBSessionDependency,
+    PaginationCursorDependency,
+    PaginationLimitDependency,
+)
+from app.crud.base import get_next_cursor
 from app.crud.orders import crud_order
 
 router = APIRouter(dependencies=[UserDependency])
@@ -17,6 +24,7 @@ router = APIRouter(dependencies=[UserDependency])
     summary="Create a new order",
 )
 async def create_order(
+    background_tasks: BackgroundTasks,
     order: schemas.OrderCreate,
     current_user: CurrentUserDependency,
     db: DBSessionDependency,
@@ -36,11 +44,16 @@ async def create_order(
     order = await crud_order.create(
         db=db, order=order, user_id=current_user.user_id
     )
-    return {
-        "data": order,
-        "message": "Order created successfully",
-        "status_code": status.HTTP_201_CREATED,
-    }
+    # the ordered products' stock changed once the order is committed
+    background_tasks.add_task(clear_product_cache)
+    return ORJSONResponse(
+        schemas.OrderPublic.dump(
+            order,
+            message="Order created successfully",
+            status_code=status.HTTP_201_CREATED,
+        ),
+        status_code=status.HTTP_201_CREATED,
+    )
 
 
 @router.get(
@@ -53,6 +66,7 @@ async def get_orders(
     db: DBSessionDependency,
     skip: int = 0,
     limit: int = PaginationLimitDependency,
+    after: UUID | None = PaginationCursorDependency,
 ):
     """
     Retrieve all orders with optional pagination.
@@ -63,10 +77,17 @@ async def get_orders(
     purposes or for users with the appropriate permissions.
 
     Omitting the `skip` and `limit` will return the first 10 orders by default.
+    For deep pages, pass the `next_cursor` of the previous page as `after`
+    instead of using `skip`.
     """
-    orders = crud_order.get_all(db=db, skip=skip, limit=limit)
+    orders = await crud_order.get_all(
+        db=db, skip=skip, limit=limit, after=after
+    )
+    next_cursor = get_next_cursor(orders, limit=limit, key="order_id")
 
-    return {"data": orders}
+    return ORJSONResponse(
+        schemas.OrdersPublic.serialize(orders, next_cursor=next_cursor)
+    )
 
 
 @router.get(
@@ -86,7 +107,8 @@ async def get_order(order_id: UUID, db: DBSessionDependency):
     An error is encountered if the order is not found in the database or if
     any error occurs during the database query process.
     """
-    return {"data": crud_order.get_by_id(order_id=order_id, db=db)}
+    order = await crud_order.get_by_id(order_id=order_id, db=db)
+    return ORJSONResponse(schemas.OrderPublic.dump(order))
 
 
 @router.put(
@@ -95,6 +117,7 @@ async def get_order(order_id: UUID, db: DBSessionDependency):
     summary="Update an order",
 )
 async def update_order(
+    background_tasks: BackgroundTasks,
     order_id: UUID,
     orders: schemas.OrderUpdate,
     current_user: CurrentUserDependency,
@@ -110,15 +133,15 @@ async def update_order(
     This request would update the specified order with the new items and
     instructions provided in the request body.
     """
-    order = crud_order.update(
+    order = await crud_order.update(
         order_id=order_id, orders=orders, user_id=current_user.user_id, db=db
     )
+    # the ordered products' stock changed once the order is committed
+    background_tasks.add_task(clear_product_cache)
 
-    return {
-        "data": order,
-        "message": "Order updated successfully",
-        "status_code": status.HTTP_200_OK,
-    }
+    return ORJSONResponse(
+        schemas.OrderPublic.dump(order, message="Order updated successfully")
+    )
 
 
 @router.delete(
@@ -127,6 +150,7 @@ async def update_order(
     summary="Delete an order",
 )
 async def delete_order(
+    background_tasks: BackgroundTasks,
     order_id: UUID,
     db: DBSessionDependency,
     current_user: CurrentUserDependency,
@@ -141,6 +165,8 @@ async def delete_order(
 
     Where `{order_id}` is the UUID of the order to be deleted.
     """
-    return crud_order.delete(
+    await crud_order.delete(
         order_id=order_id, db=db, user_id=current_user.user_id
     )
+    # products show their orders, which changed once this is committed
+    background_tasks.add_task(clear_product_cache)
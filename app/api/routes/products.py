@@ -1,15 +1,156 @@
+import asyncio
+from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status
+from anyio import to_thread
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.responses import ORJSONResponse
+from fastapi_cache.decorator import cache
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import schemas, utils
-from app.api import CurrentUserDependency, UserDependency
-from app.core.deps import DBSessionDependency, PaginationLimitDependency
+from app.api import SellerDependency, UserDependency
+from app.core.cache import (
+    PRODUCTS_NAMESPACE,
+    clear_product_cache,
+    user_scoped_key_builder,
+)
+from app.core.settings import settings
+from app.crud.base import get_next_cursor
+from app.core.deps import (
+    DBSessionDependency,
+    PaginationCursorDependency,
+    PaginationLimitDependency,
+)
 from app.crud.products import crud_product
 
 router = APIRouter(dependencies=[UserDependency])
 
 
+async def get_saved_image_paths():
+    """
+    Yields a list for the paths of the images a request saves.
+
+    The images are deleted if the request fails, such as when the product
+    can't be inserted, so they aren't left on disk without a product.
+    """
+    saved_paths: list[str] = []
+    try:
+        yield saved_paths
+    except Exception:
+        await to_thread.run_sync(utils.delete_images, saved_paths)
+        raise
+
+
+SavedImagePathsDependency = Annotated[
+    list[str], Depends(get_saved_image_paths)
+]
+
+
+async def get_image_paths(
+    images: list[UploadFile] | None,
+    image_paths: list[str] | None,
+    *,
+    owner_id: UUID,
+    db: AsyncSession,
+    saved_paths: list[str],
+) -> list[str]:
+    """
+    Saves the images sent with a request.
+
+    Args:
+        images (list[UploadFile] | None): The images sent as form data.
+        image_paths (list[str] | None): The paths of images uploaded
+        beforehand.
+        owner_id (UUID): The ID of the user sending the images.
+        db (AsyncSession): The database session.
+        saved_paths (list[str]): The list the paths of the saved images are
+        added to.
+
+    Returns:
+        list[str]: The paths of all the images.
+
+    Raises:
+        HTTPException: If a path is not of an image the user uploaded, is
+        given twice, or is already used by a product.
+    """
+    image_paths = image_paths or []
+    if len(set(image_paths)) != len(image_paths) or not (
+        await utils.are_uploaded_images(image_paths, owner_id=owner_id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only paths of images you uploaded can be used.",
+        )
+
+    if await crud_product.get_attached_image_paths(
+        db=db, image_paths=image_paths
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="An uploaded image can only be used by one product.",
+        )
+
+    saved_paths.extend(
+        await asyncio.gather(
+            *(
+                utils.save_image(image, owner_id=owner_id)
+                for image in images or []
+            )
+        )
+    )
+    return [*saved_paths, *image_paths]
+
+
+@router.put(
+    "/images/{filename}",
+    response_model=schemas.ImageUploadPublic,
+    status_code=status.HTTP_201_CREATED,
+    summary="Upload a product image",
+)
+async def upload_image(
+    filename: str, request: Request, user: SellerDependency
+):
+    """
+    Uploads an image to add to a product later.
+
+    This authenticated endpoint allows users with the role of `seller` to
+    upload an image as the raw request body. The image is written to disk as
+    it is received, which is cheaper than sending it as form data. The
+    returned `file_path` can then be passed in `image_paths` when creating or
+    updating a product.
+
+    The `Content-Type` header must be `image/gif`, `image/jpeg`, `image/png`
+    or `image/webp`, and the image can't be larger than the configured
+    maximum size.
+    """
+    if not utils.is_image_content_type(request.headers.get("content-type")):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Only GIF, JPEG, PNG and WebP images can be uploaded.",
+        )
+
+    # rejected before reading the body when its declared size is too large
+    size = request.headers.get("content-length", "")
+    if size.isdigit() and int(size) > settings.max_image_size:
+        raise utils.get_image_too_large_error()
+
+    file_path = await utils.save_image_stream(
+        filename=filename, chunks=request.stream(), owner_id=user.user_id
+    )
+    return {"data": {"file_path": file_path}}
+
+
 @router.post(
     "",
     response_model=schemas.ProductPublic,
@@ -17,12 +158,15 @@ router = APIRouter(dependencies=[UserDependency])
     summary="Create a new product",
 )
 async def create_product(
+    background_tasks: BackgroundTasks,
     db: DBSessionDependency,
-    user: CurrentUserDependency,
+    user: SellerDependency,
+    saved_paths: SavedImagePathsDependency,
     name: str = Form(...),
     description: str = Form(...),
     unit_price: float = Form(...),
-    images: list[UploadFile] = File(...),
+    images: list[UploadFile] = File(None),
+    image_paths: list[str] = Form(None),
     in_stock: bool = Form(...),
     number_in_stock: int = Form(...),
 ):
@@ -33,18 +177,12 @@ async def create_product(
     create a new product by providing its details. The product's information,
     including name, description, unit price, stock status, and number in
     stock, is submitted through form data. Images for the product can be
-    uploaded as files.
+    uploaded as files, or uploaded beforehand and passed in `image_paths`.
 
     An error is encountered If the current user's role is not `seller`,
     indicating they are not authorized to create a product. This operation
     requires the user to be authenticated and authorized as a `seller`.
     """
-    if user.role != "seller":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are not authorized to perform this action.",
-        )
-
     product = schemas.ProductCreate(
         name=name,
         description=description,
@@ -54,29 +192,54 @@ async def create_product(
         product_owner_id=user.user_id,
     )
 
-    image_paths = [utils.save_image(image) for image in images]
-    product = crud_product.create(
+    if not images and not image_paths:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one image is required.",
+        )
+
+    image_paths = await get_image_paths(
+        images,
+        image_paths,
+        owner_id=user.user_id,
+        db=db,
+        saved_paths=saved_paths,
+    )
+    product = await crud_product.create(
         db=db,
         product=product,
         image_paths=image_paths,
     )
-
-    return {
-        "data": product,
-        "message": "Product created successfully.",
-        "status_code": status.HTTP_201_CREATED,
-    }
+    # cleared once the product is committed, so it isn't cached as missing
+    background_tasks.add_task(clear_product_cache)
+
+    return ORJSONResponse(
+        schemas.ProductPublic.dump(
+            product,
+            message="Product created successfully.",
+            status_code=status.HTTP_201_CREATED,
+        ),
+        status_code=status.HTTP_201_CREATED,
+    )
 
 
+# cached responses are stored serialized, so they skip the response model
 @router.get(
     "",
-    response_model=schemas.ProductsPublic,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": schemas.ProductsPublic}},
     summary="Retrieve all products",
 )
+@cache(
+    expire=settings.cache_expire,
+    namespace=PRODUCTS_NAMESPACE,
+    key_builder=user_scoped_key_builder,
+)
 async def get_products(
     db: DBSessionDependency,
     skip: int = 0,
     limit: int = PaginationLimitDependency,
+    after: UUID | None = PaginationCursorDependency,
 ):
     """
     Retrieves all products with pagination.
@@ -84,17 +247,29 @@ async def get_products(
     This authenticated endpoint provides a list of all products available in
     the database for authenticated users. It supports pagination through
     `skip` and `limit` query parameters, allowing clients to fetch products
-    in manageable chunks.
+    in manageable chunks. For deep pages, pass the `next_cursor` of the
+    previous page as `after` instead of using `skip`.
     """
-    products = crud_product.get_all(db=db, skip=skip, limit=limit)
-    return {"data": products}
+    products = await crud_product.get_all(
+        db=db, skip=skip, limit=limit, after=after
+    )
+    return schemas.ProductsPublic.dump(
+        products,
+        next_cursor=get_next_cursor(products, limit=limit, key="product_id"),
+    )
 
 
 @router.get(
     "/{product_id}",
-    response_model=schemas.ProductPublic,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": schemas.ProductPublic}},
     summary="Retrieve a product by ID",
 )
+@cache(
+    expire=settings.cache_expire,
+    namespace=PRODUCTS_NAMESPACE,
+    key_builder=user_scoped_key_builder,
+)
 async def get_product(product_id: UUID, db: DBSessionDependency):
     """
     Retrieve a product by its unique identifier (UUID).
@@ -109,7 +284,8 @@ async def get_product(product_id: UUID, db: DBSessionDependency):
     provide users with detailed information about a product they may be
     interested in purchasing or learning more about.
     """
-    return {"data": crud_product.get_by_id(product_id=product_id, db=db)}
+    product = await crud_product.get_by_id(product_id=product_id, db=db)
+    return schemas.ProductPublic.dump(product)
 
 
 @router.put(
@@ -118,8 +294,10 @@ async def get_product(product_id: UUID, db: DBSessionDependency):
     summary="Update a product",
 )
 async def update_product(
+    background_tasks: BackgroundTasks,
     db: DBSessionDependency,
-    owner: CurrentUserDependency,
+    owner: SellerDependency,
+    saved_paths: SavedImagePathsDependency,
     product_id: UUID,
     name: str = Form(None),
     description: str = Form(None),
@@ -127,6 +305,7 @@ async def update_product(
     in_stock: bool = Form(None),
     number_in_stock: int = Form(None),
     images: list[UploadFile] = File(None),
+    image_paths: list[str] = Form(None),
 ):
     """
     Updates an existing product in the database.
@@ -135,7 +314,8 @@ async def update_product(
     update the details of an existing product by providing its unique
     identifier (UUID) and the new values for its attributes. The product's
     name, description, unit price, stock status, and number in stock can be
-    updated. Additionally, new images for the product can be uploaded.
+    updated. Additionally, new images for the product can be uploaded, or
+    uploaded beforehand and passed in `image_paths`.
 
     This operation requires user authentication and authorization as the
     product's owner. It involves updating the product's details in the
@@ -154,18 +334,24 @@ async def update_product(
     filtered_params = {k: v for k, v in params.items() if v is not None}
 
     product = schemas.ProductUpdate(**filtered_params)
-    image_paths = (
-        [utils.save_image(image) for image in images] if images else None
+    image_paths = await get_image_paths(
+        images,
+        image_paths,
+        owner_id=owner.user_id,
+        db=db,
+        saved_paths=saved_paths,
     )
-    updated_product = crud_product.update(
+    updated_product = await crud_product.update(
         db=db, product=product, image_paths=image_paths, product_id=product_id
     )
+    # cleared once the change is committed, so it can't be cached as it was
+    background_tasks.add_task(clear_product_cache)
 
-    return {
-        "message": "Product updated successfully",
-        "status_code": status.HTTP_200_OK,
-        "data": updated_product,
-    }
+    return ORJSONResponse(
+        schemas.ProductPublic.dump(
+            updated_product, message="Product updated successfully"
+        )
+    )
 
 
 @router.delete(
@@ -174,8 +360,9 @@ async def update_product(
     summary="Delete a product",
 )
 async def delete_product(
+    background_tasks: BackgroundTasks,
     product_id: UUID,
-    current_user: CurrentUserDependency,
+    current_user: SellerDependency,
     db: DBSessionDependency,
 ):
     """
@@ -190,9 +377,12 @@ async def delete_product(
     product's owner. It ensures that only authorized users can delete their
     products, maintaining data integrity and security.
     """
-    return crud_product.delete(
+    image_paths = await crud_product.delete(
         product_id=product_id, owner_id=current_user.user_id, db=db
     )
+    # removed once the deletion is committed, so a rollback keeps the files
+    background_tasks.add_task(utils.delete_images, image_paths)
+    background_tasks.add_task(clear_product_cache)
 
 
 @router.get(
@@ -200,7 +390,13 @@ async def delete_product(
     response_model=schemas.OrdersPublic,
     summary="Retrieve all orders for a product",
 )
-async def get_product_order(product_id: UUID, db: DBSessionDependency):
+async def get_product_order(
+    product_id: UUID,
+    db: DBSessionDependency,
+    skip: int = 0,
+    limit: int = PaginationLimitDependency,
+    after: UUID | None = PaginationCursorDependency,
+):
     """
     Retrieve all orders associated with a specific product.
 
@@ -211,8 +407,15 @@ async def get_product_order(product_id: UUID, db: DBSessionDependency):
 
     This operation requires user authentication. It is designed to provide
     sellers with detailed information about the orders for their products,
-    facilitating order management and fulfillment.
+    facilitating order management and fulfillment. It supports pagination
+    through the `skip` and `limit` query parameters, or by passing the
+    `next_cursor` of the previous page as `after`.
     """
-    product_orders = crud_product.get_orders(product_id=product_id, db=db)
+    product_orders = await crud_product.get_orders(
+        product_id=product_id, db=db, skip=skip, limit=limit, after=after
+    )
+    next_cursor = get_next_cursor(product_orders, limit=limit, key="order_id")
 
-    return {"data": product_orders}
+    return ORJSONResponse(
+        schemas.OrdersPublic.serialize(product_orders, next_cursor=next_cursor)
+    )
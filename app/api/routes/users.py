@@ -1,15 +1,27 @@
-from fastapi import APIRouter, status
-from pydantic import UUID4
+from uuid import UUID
+
+from fastapi import APIRouter, BackgroundTasks, status
+from fastapi.responses import ORJSONResponse
+from fastapi_cache.decorator import cache
 
 from app import schemas
 from app.api import CurrentUserDependency, UserDependency
-from app.core import deps
+from app.core import deps, security
+from app.core.cache import (
+    PRODUCTS_NAMESPACE,
+    clear_product_cache,
+    user_scoped_key_builder,
+)
+from app.core.settings import settings
+from app.crud.base import get_next_cursor
 from app.crud.users import crud_user
 
-router = APIRouter()
+# creating an account is the only thing that can be done without one
+public_router = APIRouter()
+router = APIRouter(dependencies=[UserDependency])
 
 
-@router.post(
+@public_router.post(
     "",
     response_model=schemas.UserPublic,
     status_code=status.HTTP_201_CREATED,
@@ -33,18 +45,20 @@ async def create_user(user: schemas.UserCreate, db: deps.DBSessionDependency):
     The converse is also true for users who are already of type `seller` to
     downgrade to a `buyer`.
     """
-    user = crud_user.create(db=db, user=user)
-    return {
-        "data": user,
-        "status_code": status.HTTP_201_CREATED,
-        "message": "User created successfully",
-    }
+    user = await crud_user.create(db=db, user=user)
+    return ORJSONResponse(
+        schemas.UserPublic.dump(
+            user,
+            status_code=status.HTTP_201_CREATED,
+            message="User created successfully",
+        ),
+        status_code=status.HTTP_201_CREATED,
+    )
 
 
 @router.get(
     "",
     response_model=schemas.UsersPublic | schemas.UserPublic,
-    dependencies=[UserDependency],
     summary="Retrieve users on the platform",
 )
 async def get_users(
@@ -52,6 +66,7 @@ async def get_users(
     db: deps.DBSessionDependency,
     skip: int = 0,
     limit: int = deps.PaginationLimitDependency,
+    after: UUID | None = deps.PaginationCursorDependency,
     username: str = None,
     email: str = None,
 ):
@@ -78,7 +93,8 @@ async def get_users(
 
     This endpoint also supports pagination through the `skip` and `limit`
     query parameters, allowing you to control the number of users returned in
-    the list and to paginate through large sets of users efficiently.
+    the list. To paginate through large sets of users efficiently, pass the
+    `next_cursor` of the previous page as `after` instead of using `skip`.
 
     **Note**: This endpoint is designed with privacy in mind, ensuring that
     sensitive user information is not exposed. It is suitable for both
@@ -86,14 +102,20 @@ async def get_users(
     user lookup capabilities.
     """
     if username:
-        user = crud_user.get(by="username", identifier=username, db=db)
-        return schemas.UserPublic(data=user)
+        user = await crud_user.get_by_username(username=username, db=db)
+        return ORJSONResponse(schemas.UserPublic.dump(user))
 
     if email:
-        user = crud_user.get(by="email", identifier=email, db=db)
-        return schemas.UserPublic(data=user)
-
-    return {"data": crud_user.get_all(db=db, skip=skip, limit=limit)}
+        user = await crud_user.get_by_email(email=email, db=db)
+        return ORJSONResponse(schemas.UserPublic.dump(user))
+
+    users = await crud_user.get_all(db=db, skip=skip, limit=limit, after=after)
+    return ORJSONResponse(
+        schemas.UsersPublic.dump(
+            users,
+            next_cursor=get_next_cursor(users, limit=limit, key="user_id"),
+        )
+    )
 
 
 @router.get(
@@ -116,20 +138,28 @@ async def get_me(user: CurrentUserDependency):
     such as personalized user experiences, dashboard displays, or when
     performing actions that require user identity verification.
     """
-    return {"data": user}
+    return ORJSONResponse(schemas.UserPublic.dump(user))
 
 
+# cached responses are stored serialized, so they skip the response model
 @router.get(
     "/me/products",
-    response_model=schemas.ProductsInUserResponse,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": schemas.ProductsInUserResponse}},
     tags=["products"],
     summary="Retrieve products created by the current user",
 )
-def get_my_products(
+@cache(
+    expire=settings.cache_expire,
+    namespace=PRODUCTS_NAMESPACE,
+    key_builder=user_scoped_key_builder,
+)
+async def get_my_products(
     user: CurrentUserDependency,
     db: deps.DBSessionDependency,
     skip: int = 0,
     limit: int = deps.PaginationLimitDependency,
+    after: UUID | None = deps.PaginationCursorDependency,
 ):
     """
     This endpoint allows the current authenticated user to retrieve a list of
@@ -142,10 +172,13 @@ def get_my_products(
     `limit` parameters, allowing for scalable and user-friendly navigation
     through potentially large product catalogs.
     """
-    products = crud_user.get_products(
-        db=db, user_id=user.user_id, skip=skip, limit=limit
+    products = await crud_user.get_products(
+        db=db, user_id=user.user_id, skip=skip, limit=limit, after=after
+    )
+    return schemas.ProductsInUserResponse.serialize(
+        products,
+        next_cursor=get_next_cursor(products, limit=limit, key="product_id"),
     )
-    return {"data": products}
 
 
 @router.get(
@@ -159,6 +192,7 @@ async def get_current_user_orders(
     user: CurrentUserDependency,
     skip: int = 0,
     limit: int = deps.PaginationLimitDependency,
+    after: UUID | None = deps.PaginationCursorDependency,
 ):
     """
     This endpoint is tailored for the current authenticated user to retrieve a
@@ -175,22 +209,25 @@ async def get_current_user_orders(
     **Note**: This endpoint is usable by both `buyer` and `seller` users, as
     it provides a comprehensive view of all orders associated with the user.
     """
-    return {
-        "data": crud_user.get_orders(
-            db=db, user_id=user.user_id, skip=skip, limit=limit
+    orders = await crud_user.get_orders(
+        db=db, user_id=user.user_id, skip=skip, limit=limit, after=after
+    )
+    next_cursor = get_next_cursor(orders, limit=limit, key="order_id")
+    return ORJSONResponse(
+        schemas.OrdersInUserResponse.serialize(
+            orders, next_cursor=next_cursor
         )
-    }
+    )
 
 
 @router.get(
     "/{user_id}",
     response_model=schemas.UserPublic,
-    dependencies=[UserDependency],
     summary="Retrieve a specific user by ID",
 )
 async def get_user(
     db: deps.DBSessionDependency,
-    user_id: UUID4 = deps.UserIdDependency,
+    user_id: UUID = deps.UserIdDependency,
 ):
     """
     This endpoint is designed to retrieve detailed information about a
@@ -207,13 +244,15 @@ async def get_user(
     based on their ID, such as viewing profiles, administrative tasks, or
     supporting user-related queries where direct identification is necessary.
     """
-    return {"data": crud_user.get(by="id", db=db, identifier=user_id)}
+    user = await crud_user.get_by_id(db=db, obj_id=user_id)
+    return ORJSONResponse(schemas.UserPublic.dump(user))
 
 
 @router.put(
     "/me", response_model=schemas.UserPublic, summary="Update current user"
 )
 async def update_current_user(
+    background_tasks: BackgroundTasks,
     current_user: CurrentUserDependency,
     user_data: schemas.UserUpdate,
     db: deps.DBSessionDependency,
@@ -228,18 +267,22 @@ async def update_current_user(
     as it empowers users with control over their personal information,
     enhancing their overall experience with the application.
     """
-    user = crud_user.update(
+    user = await crud_user.update(
         db=db,
         schema=user_data,
         obj_id=current_user.user_id,
         obj_owner_id=current_user.user_id,
     )
+    # forgotten once the request's changes are committed
+    background_tasks.add_task(
+        security.forget_current_user, current_user.user_id
+    )
+    # products show their owner, so they are cleared with the user
+    background_tasks.add_task(clear_product_cache)
 
-    return {
-        "data": user,
-        "message": "User updated successfully",
-        "status_code": status.HTTP_200_OK,
-    }
+    return ORJSONResponse(
+        schemas.UserPublic.dump(user, message="User updated successfully")
+    )
 
 
 @router.put(
@@ -248,10 +291,11 @@ async def update_current_user(
     summary="Update a user by ID",
 )
 async def update_user(
+    background_tasks: BackgroundTasks,
     current_user: CurrentUserDependency,
     user_data: schemas.UserUpdate,
     db: deps.DBSessionDependency,
-    user_id: UUID4 = deps.UserIdDependency,
+    user_id: UUID = deps.UserIdDependency,
 ):
     """
     Updates a user's information based on the provided user ID and update data.
@@ -266,18 +310,20 @@ async def update_user(
     returns a JSON response containing the updated user information, a success
     message, and the HTTP status code 200 OK.
     """
-    user = crud_user.update(
+    user = await crud_user.update(
         db=db,
         schema=user_data,
         obj_id=user_id,
         obj_owner_id=current_user.user_id,
     )
+    # forgotten once the request's changes are committed
+    background_tasks.add_task(security.forget_current_user, user_id)
+    # products show their owner, so they are cleared with the user
+    background_tasks.add_task(clear_product_cache)
 
-    return {
-        "data": user,
-        "message": "User updated successfully",
-        "status_code": status.HTTP_200_OK,
-    }
+    return ORJSONResponse(
+        schemas.UserPublic.dump(user, message="User updated successfully")
+    )
 
 
 @router.delete(
@@ -286,6 +332,7 @@ async def update_user(
     summary="Delete current user",
 )
 async def delete_current_user(
+    background_tasks: BackgroundTasks,
     db: deps.DBSessionDependency,
     current_user: CurrentUserDependency,
 ):
@@ -296,14 +343,21 @@ async def delete_current_user(
     account. It ensures that the operation is secure and that only the account
     owner can initiate and complete the deletion process.
     """
-    return crud_user.delete(
+    await crud_user.delete(
         db=db, obj_id=current_user.user_id, obj_owner_id=current_user.user_id
     )
+    # forgotten once the request's changes are committed
+    background_tasks.add_task(
+        security.forget_current_user, current_user.user_id
+    )
+    # products show their owner, so they are cleared with the user
+    background_tasks.add_task(clear_product_cache)
 
 
 @router.delete("/{user_id}", status_code=204, summary="Delete a user by ID")
 async def delete_user(
-    user_id: UUID4,
+    background_tasks: BackgroundTasks,
+    user_id: UUID,
     db: deps.DBSessionDependency,
     current_user: CurrentUserDependency,
 ):
@@ -320,23 +374,27 @@ async def delete_user(
     - the current user does not have the rights to delete the account
     - any other error occurs during the deletion process.
     """
-    return crud_user.delete(
+    await crud_user.delete(
         db=db, obj_id=user_id, obj_owner_id=current_user.user_id
     )
+    # forgotten once the request's changes are committed
+    background_tasks.add_task(security.forget_current_user, user_id)
+    # products show their owner, so they are cleared with the user
+    background_tasks.add_task(clear_product_cache)
 
 
 @router.get(
     "/{user_id}/orders",
     response_model=schemas.OrdersInUserResponse,
-    dependencies=[UserDependency],
     summary="Retrieve orders made by a specific user",
     tags=["orders"],
 )
 async def get_user_orders(
     db: deps.DBSessionDependency,
-    user_id: UUID4 = deps.UserIdDependency,
+    user_id: UUID = deps.UserIdDependency,
     skip: int = 0,
     limit: int = deps.PaginationLimitDependency,
+    after: UUID | None = deps.PaginationCursorDependency,
 ):
     """
     Retrieves all orders made by a specific user.
@@ -345,25 +403,35 @@ async def get_user_orders(
     user, identified by their unique user ID. It ensures data privacy and
     integrity by allowing only authorized access to user order information.
     """
-    return {
-        "data": crud_user.get_orders(
-            db=db, user_id=user_id, skip=skip, limit=limit
+    orders = await crud_user.get_orders(
+        db=db, user_id=user_id, skip=skip, limit=limit, after=after
+    )
+    next_cursor = get_next_cursor(orders, limit=limit, key="order_id")
+    return ORJSONResponse(
+        schemas.OrdersInUserResponse.serialize(
+            orders, next_cursor=next_cursor
         )
-    }
+    )
 
 
 @router.get(
     "/{user_id}/products",
-    response_model=schemas.ProductsInUserResponse,
-    dependencies=[UserDependency],
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": schemas.ProductsInUserResponse}},
     summary="Retrieve products created by a specific user",
     tags=["products"],
 )
+@cache(
+    expire=settings.cache_expire,
+    namespace=PRODUCTS_NAMESPACE,
+    key_builder=user_scoped_key_builder,
+)
 async def get_user_products(
     db: deps.DBSessionDependency,
-    user_id: UUID4 = deps.UserIdDependency,
+    user_id: UUID = deps.UserIdDependency,
     skip: int = 0,
     limit: int = deps.PaginationLimitDependency,
+    after: UUID | None = deps.PaginationCursorDependency,
 ):
     """
     Retrieve products created by a specific user.
@@ -382,7 +450,10 @@ async def get_user_products(
     does not exist in the database, an error will be encountered and returned
     to the user.
     """
-    result = crud_user.get_products(
-        db=db, user_id=user_id, skip=skip, limit=limit
+    result = await crud_user.get_products(
+        db=db, user_id=user_id, skip=skip, limit=limit, after=after
+    )
+    return schemas.ProductsInUserResponse.serialize(
+        result,
+        next_cursor=get_next_cursor(result, limit=limit, key="product_id"),
     )
-    return {"data": result}
@@ -0,0 +1,68 @@
+import hashlib
+
+from fastapi import Request
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+from app.core.settings import settings
+
+# the namespace of the cached responses that show products, which change
+# with their products, orders and owners
+PRODUCTS_NAMESPACE = "products"
+
+
+def init_cache() -> None:
+    """
+    Sets up the response cache.
+
+    Redis is used when `settings.redis_url` is set so every worker shares the
+    cache, otherwise each worker keeps its own in memory.
+    """
+    if settings.redis_url:
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis import asyncio as aioredis
+
+        backend = RedisBackend(aioredis.from_url(settings.redis_url))
+    else:
+        backend = InMemoryBackend()
+
+    FastAPICache.init(backend, prefix=settings.cache_prefix)
+
+
+async def clear_product_cache() -> None:
+    """
+    Removes the cached responses that show products.
+
+    Call this once a change to products is committed, such as from a
+    background task, so the old products can't be cached again.
+    """
+    await FastAPICache.clear(namespace=PRODUCTS_NAMESPACE)
+
+
+def user_scoped_key_builder(
+    func,
+    namespace: str = "",
+    *,
+    request: Request | None = None,
+    response=None,
+    args=(),
+    kwargs=None,
+) -> str:
+    """
+    Builds a cache key from the route, its query and the caller's token.
+
+    The endpoint arguments are left out since they include the database
+    session, which is different for every request. The key starts with the
+    cache prefix and the namespace, so a namespace can be cleared at once.
+    """
+    raw_key = ":".join(
+        (
+            func.__module__,
+            func.__qualname__,
+            request.url.path if request else "",
+            str(sorted(request.query_params.multi_items())) if request else "",
+            request.headers.get("authorization", "") if request else "",
+        )
+    )
+    digest = hashlib.blake2b(raw_key.encode(), digest_size=16).hexdigest()
+    return f"{FastAPICache.get_prefix()}:{namespace}:{digest}"
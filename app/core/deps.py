@@ -2,12 +2,12 @@ from typing import Annotated
 
 from fastapi import Depends, Path, Query
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.settings import settings
 
-from app.db.session import get_session
+from app.db.session import get_async_session
 
-DBSessionDependency = Annotated[Session, Depends(get_session)]
+DBSessionDependency = Annotated[AsyncSession, Depends(get_async_session)]
 UserIdDependency = Path(..., description="The user's ID.")
 PaginationLimitDependency = Query(
     default=settings.pagination_default_page,
@@ -15,6 +15,11 @@ PaginationLimitDependency = Query(
     ge=1,
     description="The number of items to return.",
 )
+PaginationCursorDependency = Query(
+    default=None,
+    description="The `next_cursor` of the previous page. It is used instead "
+    "of `skip` when given.",
+)
 
 OAuth2SchemeDependency = Annotated[
     str, Depends(OAuth2PasswordBearer(tokenUrl=settings.login_route))
@@ -0,0 +1,72 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.session import get_parallel_session
+
+
+class BatchLoader:
+    """
+    Loads objects by key, batching concurrent loads into a single query.
+
+    Keys requested while the event loop is busy with other requests are
+    collected and loaded together on its next iteration, so a burst of
+    requests costs one round trip to the database instead of one each.
+
+    Attributes:
+        load_many: Loads the objects with the given keys, returning them by
+        key.
+    """
+
+    def __init__(
+        self, load_many: Callable[[AsyncSession, list], Awaitable[dict]]
+    ):
+        """
+        Initialize the BatchLoader class.
+
+        Args:
+            load_many: Loads the objects with the given keys using the given
+            session, returning them by key.
+        """
+        self.load_many = load_many
+        self.pending: dict[Hashable, asyncio.Future] = {}
+        self.dispatch_task: asyncio.Task | None = None
+
+    async def load(self, key: Hashable, *, db: AsyncSession):
+        """
+        Loads the object with the given key.
+
+        Args:
+            key: The key of the object.
+            db: The session of the request, used to reach its database.
+
+        Returns:
+            The object, or None if there is none with the key.
+        """
+        if key not in self.pending:
+            if not self.pending:
+                # runs once the requests already waiting to run get their turn
+                self.dispatch_task = asyncio.create_task(self.dispatch(db=db))
+            self.pending[key] = asyncio.get_running_loop().create_future()
+
+        # a cancelled request must not cancel the load for the others
+        return await asyncio.shield(self.pending[key])
+
+    async def dispatch(self, *, db: AsyncSession) -> None:
+        """
+        Loads all the pending keys and hands the objects to their requests.
+
+        Args:
+            db: The session of a request, used to reach its database.
+        """
+        batch, self.pending = self.pending, {}
+        try:
+            async with get_parallel_session(db) as batch_db:
+                objects = await self.load_many(batch_db, list(batch))
+        except Exception as error:
+            for future in batch.values():
+                future.set_exception(error)
+        else:
+            for key, future in batch.items():
+                future.set_result(objects.get(key))
@@ -1,44 +1,146 @@
-from datetime import datetime, timedelta
-
+import contextlib
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+import bcrypt
 import jwt
+import sqlalchemy as sa
+from cachetools import TTLCache
 from fastapi import HTTPException, status
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
-from pydantic import UUID4, EmailStr
-from sqlmodel import SQLModel
+from pydantic import EmailStr
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app import schemas
+from app import schemas, utils
 from app.core import deps
 from app.core.deps import DBSessionDependency
+from app.core.loader import BatchLoader
 from app.core.settings import settings
 from app.db import models
+from app.db.session import AsyncSessionLocal
+
+# HS256 is HMAC-SHA256, which hashlib computes with OpenSSL
+ACCESS_TOKEN_KEY = settings.secret_key.encode()
+ACCESS_TOKEN_ALGORITHMS = [settings.oauth2_algorithm]
+
+# checked when there is no real hash, so every check costs the same
+DUMMY_PASSWORD_HASH = bcrypt.hashpw(
+    b"not-a-real-password", bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+)
+
+# recent successful password checks, keyed by the hash and the password's
+# SHA-256 digest; a changed password has a new hash, so it is never matched
+verified_password_cache = TTLCache(
+    maxsize=settings.verified_password_cache_size,
+    ttl=settings.verified_password_cache_ttl,
+)
+# passwords are checked in worker threads
+verified_password_lock = threading.Lock()
+
+# recently verified tokens with their claims and expiry time
+verified_token_cache = TTLCache(
+    maxsize=settings.access_token_cache_size,
+    ttl=settings.access_token_cache_ttl,
+)
+
+# users recently loaded by `get_current_user`, keyed by user ID
+current_user_cache = TTLCache(
+    maxsize=settings.current_user_cache_size,
+    ttl=settings.current_user_cache_ttl,
+)
+# when each user was last removed from `current_user_cache`; a load that
+# started before then may have read the old row, so it isn't cached
+forgotten_user_times = TTLCache(
+    maxsize=settings.current_user_cache_size,
+    ttl=settings.current_user_cache_ttl,
+)
+
+
+async def load_users(db: AsyncSession, user_ids: list) -> dict:
+    """Returns the users with the given IDs, keyed by user ID."""
+    query = select(models.User).where(models.User.user_id.in_(user_ids))
+    return {user.user_id: user for user in await db.exec(query)}
+
+
+# users authenticating at the same time are loaded with a single query
+current_user_loader = BatchLoader(load_users)
+
+
+def is_valid_password(
+    *, plain_password: str, hashed_password: str | None
+) -> bool:
+    """
+    Checks a password against its hash.
+
+    A dummy hash is checked when the hash is missing or malformed, so a
+    failed check takes as long as a successful one. Successful checks are
+    remembered for a short while so repeated logins skip bcrypt.
+    """
+    password = plain_password.encode("utf-8")
+    if hashed_password:
+        cache_key = (hashed_password, hashlib.sha256(password).digest())
+        with verified_password_lock:
+            if cache_key in verified_password_cache:
+                return True
+
+        with contextlib.suppress(ValueError):
+            if not bcrypt.checkpw(password, hashed_password.encode("utf-8")):
+                return False
+
+            with verified_password_lock:
+                verified_password_cache[cache_key] = True
+            return True
+
+    bcrypt.checkpw(password, DUMMY_PASSWORD_HASH)
+    return False
+
+
+async def rehash_password(
+    *, user_id: UUID, plain_password: str, hashed_password: str
+) -> None:
+    """
+    Replaces a user's password hash with one using the configured cost.
+
+    This runs after a successful login whose hash was made with another
+    cost. The hash is only replaced if the password hasn't changed since.
+    """
+    new_hash = await utils.hash_password_in_thread(password=plain_password)
+    async with AsyncSessionLocal() as db:
+        await db.exec(
+            sa.update(models.User)
+            .where(
+                models.User.user_id == user_id,
+                models.User.password == hashed_password,
+            )
+            .values(password=new_hash)
+        )
+        await db.commit()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def is_valid_password(*, plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    forget_current_user(user_id)
 
 
 def create_access_token(
     data: dict, expires_delta: timedelta | None = None
-) -> str:
-    """Creates a JWT Access Token for API access."""
+) -> tuple[str, datetime]:
+    """Creates a JWT Access Token for API access, returning its expiry too."""
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.now() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.now() + timedelta(
+        expire = datetime.now(timezone.utc) + timedelta(
             minutes=settings.access_token_expire_minutes
         )
     to_encode["exp"] = expire
     encoded_jwt = jwt.encode(
         payload=to_encode,
-        key=settings.secret_key,
+        key=ACCESS_TOKEN_KEY,
         algorithm=settings.oauth2_algorithm,
     )
-    settings.access_token_duration = expire
-    return encoded_jwt
+    return encoded_jwt, expire
 
 
 async def verify_access_token(
@@ -46,18 +148,29 @@ async def verify_access_token(
     credentials_exception: HTTPException,
 ) -> schemas.TokenPayload:
     """Verifies that the token being used is valid"""
+    if cached := verified_token_cache.get(token):
+        token_data, expires_at = cached
+        if expires_at > time.time():
+            return token_data
+
     try:
         payload = jwt.decode(
-            token, settings.secret_key, algorithms=[settings.oauth2_algorithm]
+            token, ACCESS_TOKEN_KEY, algorithms=ACCESS_TOKEN_ALGORITHMS
         )
         user_id = payload.get("sub")
         email = payload.get("email")
         if user_id is None or email is None:
             raise credentials_exception
-        token_data = schemas.TokenPayload(user_id=user_id, email=email)
-    except InvalidTokenError as error:
+        # the claims were signed by us, so they are not validated again
+        token_data = schemas.TokenPayload.model_construct(
+            user_id=UUID(user_id), email=email
+        )
+    except (InvalidTokenError, ValueError) as error:
         raise credentials_exception from error
 
+    # tokens without an expiry are never reused from the cache
+    verified_token_cache[token] = (token_data, payload.get("exp", 0))
+
     return token_data
 
 
@@ -73,10 +186,31 @@ async def get_current_user(
 
     token_data = await verify_access_token(token, credentials_exception)
 
-    if user := db.get(models.User, token_data.user_id):
-        return user
-    else:
-        raise credentials_exception
+    user = current_user_cache.get(token_data.user_id)
+    if not user:
+        load_started_at = time.monotonic()
+        user = await current_user_loader.load(token_data.user_id, db=db)
+        if not user:
+            raise credentials_exception
+
+        forgotten_at = forgotten_user_times.get(token_data.user_id, 0)
+        if forgotten_at < load_started_at:
+            current_user_cache[token_data.user_id] = user
+
+    # attach a copy to this request's session without querying again
+    return await db.merge(user, load=False)
+
+
+def forget_current_user(user_id: UUID) -> None:
+    """
+    Removes a user from the current user cache after it changes.
+
+    Call this once the change is committed, such as from a background task,
+    so the user can't be loaded from the old row and cached again. Loads
+    that were already running when it is called are not cached either.
+    """
+    forgotten_user_times[user_id] = time.monotonic()
+    current_user_cache.pop(user_id, None)
 
 
 class Token(SQLModel):
@@ -86,5 +220,5 @@ class Token(SQLModel):
 
 
 class TokenPayload(SQLModel):
-    user_id: UUID4
+    user_id: UUID
     email: EmailStr
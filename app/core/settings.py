@@ -1,6 +1,6 @@
-from datetime import datetime
+from functools import lru_cache
 
-from pydantic import ConfigDict
+from pydantic import ConfigDict, model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -25,6 +25,37 @@ class Settings(BaseSettings):
     passwords (default is 8).
     - **maximum_password_length**: The maximum allowed length for user
     passwords (default is 15).
+    - **db_pool_size**: The number of database connections each worker keeps
+    open. Keep `db_pool_size + db_max_overflow` times the number of workers
+    below the server's `max_connections` (default is 20).
+    - **db_max_overflow**: The number of extra connections opened when the
+    pool is exhausted (default is 10).
+    - **db_pool_timeout**: The number of seconds to wait for a free
+    connection before giving up (default is 30).
+    - **db_pool_recycle**: The number of seconds after which a connection is
+    replaced (default is 1800).
+    - **bcrypt_rounds**: The bcrypt cost of new password hashes. Hashes with
+    another cost are replaced after a successful login (default is 10).
+    - **current_user_cache_size**: The number of authenticated users kept in
+    memory (default is 10000).
+    - **current_user_cache_ttl**: The number of seconds an authenticated user
+    is kept in memory (default is 30).
+    - **access_token_cache_size**: The number of verified access tokens kept
+    in memory (default is 10000).
+    - **access_token_cache_ttl**: The maximum number of seconds a verified
+    access token is kept in memory (default is 60).
+    - **verified_password_cache_size**: The number of successful password
+    checks kept in memory (default is 4096).
+    - **verified_password_cache_ttl**: The number of seconds a successful
+    password check is kept in memory (default is 300).
+    - **worker_threads**: The number of threads available for blocking work
+    such as hashing passwords and file I/O (default is 64).
+    - **redis_url**: The Redis URL for the response cache. Each worker caches
+    responses in memory when it is not set.
+    - **cache_expire**: The number of seconds responses are cached for
+    (default is 30).
+    - **max_image_size**: The maximum size in bytes of an image uploaded as a
+    raw request body (default is 10 MiB).
     """
 
     db_user: str | None = None
@@ -40,40 +71,85 @@ class Settings(BaseSettings):
     database_test_url: str | None = None
     prod_url: str | None = "http://localhost:8000"
     database_type: str = "sqlite"
-    model_config = ConfigDict(env_file=".env")
+    model_config = ConfigDict(env_file=".env", frozen=True)
     secret_key: str
     oauth2_algorithm: str = "HS256"
     access_token_expire_minutes: int = 3600
-    access_token_duration: datetime | None = None
     api_version: str = "v1"
     login_route: str = f"api/{api_version}/login"
     pagination_limit: int = 100
     pagination_default_page: int = 10
     api_schema_filepath: str = "app/static/api.json"
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    bcrypt_rounds: int = 10
+    current_user_cache_size: int = 10_000
+    current_user_cache_ttl: int = 30
+    access_token_cache_size: int = 10_000
+    access_token_cache_ttl: int = 60
+    verified_password_cache_size: int = 4096
+    verified_password_cache_ttl: int = 300
+    worker_threads: int = 64
+    redis_url: str | None = None
+    cache_prefix: str = "tc"
+    cache_expire: int = 30
+    max_image_size: int = 10 * 1024 * 1024
 
+    @model_validator(mode="after")
+    def derive_database_urls(self):
+        """
+        Derives the database URLs from the database settings.
 
-settings = Settings()
-
-if settings.db_database:
-    settings.db_name = settings.db_database
-
-if settings.database_type == "sqlite":
-    if settings.dev:
-        settings.database_url = f"sqlite:///{settings.db_name}_dev.db"
-        settings.database_test_url = f"sqlite:///{settings.db_name}_test.db"
-    else:
-        settings.database_url = f"sqlite:///{settings.db_name}.db"
-elif settings.dev:
-    settings.database_url = settings.database_url or (
-        f"{settings.database_type}://{settings.db_user}:{settings.db_password}"
-        f"@{settings.db_host}:{settings.db_port}/{settings.db_name}_dev"
-    )
-    settings.database_test_url = (
-        f"{settings.database_type}://{settings.db_user}:{settings.db_password}"
-        f"@{settings.db_host}:{settings.db_port}/{settings.db_name}_test"
-    )
-else:
-    settings.database_url = settings.database_url or (
-        f"{settings.database_type}://{settings.db_user}:{settings.db_password}"
-        f"@{settings.db_host}:{settings.db_port}/{settings.db_name}"
-    )
+        Returns:
+            Settings: The settings with the database URLs set.
+        """
+        # the settings are frozen once loaded, so they are set directly
+        def set_value(name, value):
+            object.__setattr__(self, name, value)
+
+        if self.db_database:
+            set_value("db_name", self.db_database)
+
+        if self.database_type == "sqlite":
+            if self.dev:
+                set_value("database_url", f"sqlite:///{self.db_name}_dev.db")
+                set_value(
+                    "database_test_url", f"sqlite:///{self.db_name}_test.db"
+                )
+            else:
+                set_value("database_url", f"sqlite:///{self.db_name}.db")
+            return self
+
+        server_url = (
+            f"{self.database_type}://{self.db_user}:{self.db_password}"
+            f"@{self.db_host}:{self.db_port}"
+        )
+        if self.dev:
+            set_value(
+                "database_url",
+                self.database_url or f"{server_url}/{self.db_name}_dev",
+            )
+            set_value("database_test_url", f"{server_url}/{self.db_name}_test")
+        else:
+            set_value(
+                "database_url",
+                self.database_url or f"{server_url}/{self.db_name}",
+            )
+
+        return self
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Returns the application settings.
+
+    The settings are loaded from the environment and the .env file on the
+    first call only; later calls return the same instance.
+    """
+    return Settings()
+
+
+settings = get_settings()
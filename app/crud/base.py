@@ -1,12 +1,77 @@
+from functools import cached_property
 from typing import Generic, TypeVar
+from uuid import UUID
 
+import sqlalchemy as sa
 from fastapi import HTTPException, status
-from sqlmodel import Session, SQLModel, select
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.settings import settings
 
 ModelType = TypeVar("ModelType")
 SchemaType = TypeVar("SchemaType", bound=SQLModel)
 
+# drops the parentheses around the key and its value and quotes with '
+ERROR_DETAIL_TRANSLATION = str.maketrans({"(": None, ")": None, '"': "'"})
+
+
+def paginate(
+    query,
+    model,
+    *,
+    skip: int = 0,
+    limit: int = settings.pagination_default_page,
+    after: UUID | None = None,
+):
+    """
+    Applies pagination to a query on a model, newest objects first.
+
+    When `after` is given, the page continues from the object with that ID
+    (keyset pagination), so the database doesn't walk past every earlier row
+    like it does with `skip`.
+
+    Args:
+        query: The query to paginate.
+        model: The model the query selects from.
+        skip: The number of objects to skip when `after` is not given.
+        limit: The maximum number of objects to return.
+        after: The ID of the last object of the previous page.
+
+    Returns:
+        The paginated query.
+    """
+    primary_key = sa.inspect(model).primary_key[0]
+    query = query.order_by(model.created_at.desc(), primary_key.desc())
+
+    if after is None:
+        return query.offset(skip).limit(limit)
+
+    after_created_at = (
+        select(model.created_at).where(primary_key == after).scalar_subquery()
+    )
+    return query.where(
+        sa.tuple_(model.created_at, primary_key)
+        < sa.tuple_(after_created_at, sa.literal(after, primary_key.type))
+    ).limit(limit)
+
+
+def get_next_cursor(items: list, *, limit: int, key: str) -> UUID | None:
+    """
+    Returns the cursor for the page after the given items.
+
+    Args:
+        items: The items of the current page.
+        limit: The page size that was requested.
+        key: The name of the items' ID attribute.
+
+    Returns:
+        The ID of the last item, or None when this is the last page.
+    """
+    if items and len(items) == limit:
+        return getattr(items[-1], key)
+
+    return None
+
 
 class APICrudBase(Generic[ModelType, SchemaType]):
     """
@@ -19,20 +84,34 @@ class APICrudBase(Generic[ModelType, SchemaType]):
     Attributes:
         model: The model used for CRUD operations.
         model_name: The name of the model in lowercase.
+        not_found_error: The error raised when an object is not found.
+        load_options: The loader options for the relationships rendered in
+        the model's responses.
 
     Methods:
         get_detailed_error: Returns a detailed error message.
         get_by_id: Returns a single object by its id.
+        exists: Returns whether an object exists.
         get_all: Returns all objects of the model.
         create: Creates a new object.
         update: Updates an existing object.
         delete: Deletes an object.
     """
 
+    load_options: tuple = ()
+
     def __init__(self, model: ModelType):
         self.model = model
-        self.model_name = model.__name__.lower()
-        self.not_found_error = HTTPException(
+
+    @cached_property
+    def model_name(self) -> str:
+        """The name of the model in lowercase, worked out once."""
+        return self.model.__name__.lower()
+
+    @cached_property
+    def not_found_error(self) -> HTTPException:
+        """The error raised when an object is not found, built when needed."""
+        return HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"{self.model_name} not found",
         )
@@ -48,25 +127,26 @@ class APICrudBase(Generic[ModelType, SchemaType]):
         Returns:
             The detailed error message.
         """
-        try:
-            detail_error = error.args[0].split("\n")[1]
-        except IndexError:
+        # the detail is on the second line of the database's message
+        lines = error.args[0].split("\n", 2)
+        if len(lines) < 2:
             return "The data provided is not correct"
 
-        detail_error = detail_error.replace("DETAIL:  Key ", "")
-        detail_error = (
-            detail_error.replace("(", "").replace(")=", " ").replace(")", "")
+        detail_error = lines[1].replace("DETAIL:  Key ", "")
+        return detail_error.replace(")=", " ").translate(
+            ERROR_DETAIL_TRANSLATION
         )
-        detail_error = detail_error.replace('"', "'")
-        return detail_error
 
-    def get_by_id(self, *, db: Session, obj_id: str) -> ModelType:
+    async def get_by_id(
+        self, *, db: AsyncSession, obj_id: str, options=None
+    ) -> ModelType:
         """
         Returns a single object by its id.
 
         Args:
             db: The database session.
             obj_id: The id of the object.
+            options: The loader options to use instead of `load_options`.
 
         Returns:
             The object with the specified id.
@@ -74,17 +154,41 @@ class APICrudBase(Generic[ModelType, SchemaType]):
         Raises:
             HTTPException: If the object is not found.
         """
-        if obj := db.get(self.model, obj_id):
+        options = self.load_options if options is None else options
+
+        # the object may already be in the session without its relationships
+        if obj := await db.get(
+            self.model,
+            obj_id,
+            options=options,
+            populate_existing=bool(options),
+        ):
             return obj
 
         raise self.not_found_error
 
-    def get_all(
+    async def exists(self, *, db: AsyncSession, obj_id: str) -> bool:
+        """
+        Returns whether an object with the given id exists.
+
+        Args:
+            db: The database session.
+            obj_id: The id of the object.
+
+        Returns:
+            True if the object exists, False otherwise.
+        """
+        primary_key = sa.inspect(self.model).primary_key[0]
+        query = select(sa.exists().where(primary_key == obj_id))
+        return (await db.exec(query)).one()
+
+    async def get_all(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         skip=0,
         limit=settings.pagination_default_page,
+        after=None,
         order_by=None,
         join_model=None,
     ):
@@ -95,6 +199,7 @@ class APICrudBase(Generic[ModelType, SchemaType]):
             db: The database session.
             skip: The number of objects to skip.
             limit: The maximum number of objects to return.
+            after: The ID of the last object of the previous page.
             order_by: The field to order the objects by.
 
         Returns:
@@ -104,7 +209,7 @@ class APICrudBase(Generic[ModelType, SchemaType]):
             HTTPException: If there is an error fetching the objects.
         """
         try:
-            query = select(self.model)
+            query = select(self.model).options(*self.load_options)
 
             if join_model:
                 query = query.join(join_model)
@@ -112,7 +217,10 @@ class APICrudBase(Generic[ModelType, SchemaType]):
             if order_by:
                 query = query.order_by(order_by)
 
-            return db.exec(query.offset(skip).limit(limit)).all()
+            query = paginate(
+                query, self.model, skip=skip, limit=limit, after=after
+            )
+            return (await db.exec(query)).all()
         except Exception as error:
             raise HTTPException(
                 detail={
@@ -122,9 +230,9 @@ class APICrudBase(Generic[ModelType, SchemaType]):
                 status_code=status.HTTP_400_BAD_REQUEST,
             ) from error
 
-    def create(
+    async def create(
         self,
-        db: Session,
+        db: AsyncSession,
         schema: SchemaType,
     ):
         """
@@ -142,14 +250,16 @@ class APICrudBase(Generic[ModelType, SchemaType]):
         """
         try:
             obj = self.model.model_validate(schema)
-            return self.model(**obj.model_dump()).save(db=db, created=True)
+            return await self.model(**obj.model_dump()).save(
+                db=db, created=True
+            )
         except Exception as error:
             raise error
 
-    def update(
+    async def update(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         schema: SchemaType,
         obj_id: str,
         obj_owner_id: str,
@@ -170,7 +280,7 @@ class APICrudBase(Generic[ModelType, SchemaType]):
             HTTPException: If the user is not authorized to update the object
             or if there is an error during update.
         """
-        db_obj = self.get_by_id(db=db, obj_id=obj_id)
+        db_obj = await self.get_by_id(db=db, obj_id=obj_id)
         if obj_owner_id != obj_id:
             raise HTTPException(
                 detail="You are not authorized to update this "
@@ -178,7 +288,7 @@ class APICrudBase(Generic[ModelType, SchemaType]):
                 status_code=status.HTTP_403_FORBIDDEN,
             )
         try:
-            return db_obj.sqlmodel_update(
+            return await db_obj.sqlmodel_update(
                 schema.model_dump(exclude_unset=True)
             ).save(db=db)
         except Exception as error:
@@ -190,10 +300,10 @@ class APICrudBase(Generic[ModelType, SchemaType]):
                 status_code=status.HTTP_400_BAD_REQUEST,
             ) from error
 
-    def delete(
+    async def delete(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         obj_id: str,
         obj_owner_id: str,
     ):
@@ -208,11 +318,11 @@ class APICrudBase(Generic[ModelType, SchemaType]):
         Raises:
             HTTPException: If the user is not authorized to delete the object.
         """
-        obj = self.get_by_id(db=db, obj_id=obj_id)
+        obj = await self.get_by_id(db=db, obj_id=obj_id)
         if obj_owner_id != obj_id:
             raise HTTPException(
                 detail="You are not authorized to delete this "
                 f"{self.model_name}",
                 status_code=status.HTTP_403_FORBIDDEN,
             )
-        obj.delete(db=db)
+        await obj.delete(db=db)
@@ -1,12 +1,59 @@
+from collections import Counter
+from uuid import UUID
+
+import sqlalchemy as sa
 from fastapi import HTTPException, status
-from sqlmodel import Session
+from sqlalchemy.orm import load_only
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import schemas
 from app.core.settings import settings
-from app.crud.base import APICrudBase
-from app.crud.products import ProductCrud
+from app.crud.base import APICrudBase, paginate
+from app.crud.products import crud_product
 from app.db import models
 
+# only the product columns needed to check and update its stock
+PRODUCT_STOCK_OPTIONS = (
+    load_only(
+        models.Product.name,
+        models.Product.in_stock,
+        models.Product.number_in_stock,
+    ),
+)
+
+# the ordered products, locked until the order is committed
+ORDERED_PRODUCTS_QUERY = (
+    select(models.Product)
+    .options(*PRODUCT_STOCK_OPTIONS)
+    .where(
+        models.Product.product_id.in_(
+            sa.bindparam("product_ids", expanding=True)
+        )
+    )
+    .with_for_update()
+)
+
+# subtracts an ordered quantity from a product, which runs out when it is all
+# bought; the new values are computed in the database from the current ones
+# and products without enough stock left are not updated
+SUBTRACT_STOCK_STATEMENT = (
+    sa.update(models.Product)
+    .where(models.Product.product_id == sa.bindparam("ordered_product_id"))
+    .where(models.Product.number_in_stock >= sa.bindparam("quantity"))
+    .values(
+        number_in_stock=models.Product.number_in_stock
+        - sa.bindparam("quantity"),
+        in_stock=sa.case(
+            (
+                models.Product.number_in_stock == sa.bindparam("quantity"),
+                False,
+            ),
+            else_=models.Product.in_stock,
+        ),
+    )
+)
+
 
 class OrderCrud(APICrudBase[models.Order, schemas.Order]):
     """
@@ -19,20 +66,32 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
         super().__init__(model)
 
     @staticmethod
-    def update_product_stock(
-        *, product: models.Product, quantity: int, db: Session
+    async def update_product_stock(
+        *, product_id: UUID, quantity: int, db: AsyncSession
     ):
         """
         Update the stock of a product.
 
+        The stock is subtracted in the database without committing, so it
+        can't drop below zero when orders are placed at the same time.
+
         Args:
-            product (models.Product): The product to update.
+            product_id (UUID): The ID of the product to update.
             quantity (int): The quantity to subtract from the product stock.
+
+        Raises:
+            HTTPException: If the product ran out of stock in the meantime.
         """
-        product.number_in_stock -= quantity
-        if product.number_in_stock == 0:
-            product.in_stock = False
-        product.save(db=db)
+        connection = await db.connection()
+        result = await connection.execute(
+            SUBTRACT_STOCK_STATEMENT,
+            {"ordered_product_id": product_id, "quantity": quantity},
+        )
+        if result.rowcount != 1:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The product ran out of stock while ordering",
+            )
 
     @staticmethod
     def verify_product_stock(*, product: models.Product, quantity: int):
@@ -62,14 +121,14 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
                 ),
             )
 
-    def create(
-        self, *, db: Session, order: schemas.OrderCreate, user_id: str
+    async def create(
+        self, *, db: AsyncSession, order: schemas.OrderCreate, user_id: str
     ) -> models.Order:
         """
         Create a new order.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             order (schemas.OrderCreate): The order data.
             user_id (str): The ID of the user placing the order.
 
@@ -80,92 +139,126 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
             HTTPException: If the product is not found, out of stock, or
             insufficient stock.
         """
+        quantities = Counter()
         for order_product in order.orders:
-            new_order = models.Order.model_validate(
-                order_product, update={"user_id": user_id}
-            )
+            quantities[order_product.product_id] += order_product.quantity
 
-            db_product = ProductCrud().get_by_id(
-                db=db, product_id=order_product.product_id
-            )
+        products = await db.exec(
+            ORDERED_PRODUCTS_QUERY, params={"product_ids": list(quantities)}
+        )
+        products = {product.product_id: product for product in products}
+
+        for product_id, quantity in quantities.items():
+            if product_id not in products:
+                raise crud_product.not_found_error
 
             self.verify_product_stock(
-                product=db_product, quantity=order_product.quantity
+                product=products[product_id], quantity=quantity
             )
 
-            new_order_product = models.Order(
-                order_id=new_order.order_id,
+        # the row locks don't exist on every database (SQLite), so the stock
+        # is checked again as it is subtracted before any order is added
+        for product_id, quantity in quantities.items():
+            await self.update_product_stock(
+                product_id=product_id, quantity=quantity, db=db
+            )
+
+        new_orders = []
+        for order_product in order.orders:
+            new_order = models.Order(
                 product_id=order_product.product_id,
                 quantity=order_product.quantity,
                 user_id=user_id,
             )
+            new_order.updated_at = new_order.created_at
+            new_orders.append(new_order)
+        db.add_all(new_orders)
 
-            new_order_product.save(db=db, created=True)
+        # surfaces constraint errors here; the request commits the order
+        await db.flush()
 
-            # now let's subtract the quantity bought from the product
-            self.update_product_stock(
-                db=db, product=db_product, quantity=order_product.quantity
-            )
-        return new_order_product
+        return new_orders[-1]
 
-    def get_by_id(self, *, db: Session, order_id: str) -> models.Order:
+    async def get_by_id(
+        self, *, db: AsyncSession, order_id: str
+    ) -> models.Order:
         """
         Retrieve an order by its ID.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             order_id (str): The ID of the order.
 
         Returns:
             models.Order: The retrieved order.
         """
-        return super().get_by_id(db=db, obj_id=order_id)
+        return await super().get_by_id(db=db, obj_id=order_id)
 
-    def get_all(
+    async def get_all(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         skip: int = 0,
         limit: int = settings.pagination_default_page,
-    ) -> list[models.Order]:
+        after: UUID | None = None,
+    ) -> list[schemas.Order]:
         """
         Retrieve all orders.
 
+        Only the columns shown in order listings are selected, and the rows
+        are used as-is since the database has already validated them.
+
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
+            skip (int): The number of orders to skip.
+            limit (int): The maximum number of orders to retrieve.
+            after (UUID | None): The ID of the last order of the previous
+            page.
 
         Returns:
-            list[models.Order]: A list of all orders.
+            list[schemas.Order]: A list of all orders.
         """
-        return super().get_all(
-            db=db, join_model=models.Product, skip=skip, limit=limit
+        query = select(
+            models.Order.order_id,
+            models.Order.product_id,
+            models.Order.created_at,
+            models.Order.updated_at,
         )
+        query = paginate(
+            query, models.Order, skip=skip, limit=limit, after=after
+        )
+        rows = (await db.exec(query)).all()
+
+        return [
+            schemas.Order.model_construct(**row._mapping)
+            for row in rows
+        ]
 
-    def delete(self, db: Session, order_id: str, user_id: str):
+    async def delete(self, db: AsyncSession, order_id: str, user_id: str):
         """
         Delete an order.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             order_id (str): The ID of the order to delete.
             user_id (str): The ID of the user deleting the order.
 
         Raises:
             HTTPException: If the user is not authorized to delete the order.
         """
-        db_order = self.get_by_id(db=db, order_id=order_id)
+        db_order = await self.get_by_id(db=db, order_id=order_id)
         if db_order.user_id != user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="You are not authorized to delete this order",
             )
-        db_order.delete(db=db)
+        await db_order.delete(db=db)
         return None
 
-    def update(
+    async def update(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         order_id: str,
         orders: schemas.OrderUpdate,
         user_id: str,
@@ -174,7 +267,7 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
         Update an order.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             order_id (str): The ID of the order to update.
             order (schemas.OrderUpdate): The updated order data.
             user_id (str): The ID of the user updating the order.
@@ -185,7 +278,7 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
         Raises:
             HTTPException: If the user is not authorized to update the order.
         """
-        db_order = self.get_by_id(db=db, order_id=order_id)
+        db_order = await self.get_by_id(db=db, order_id=order_id)
         if db_order.user_id != user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -193,19 +286,21 @@ class OrderCrud(APICrudBase[models.Order, schemas.Order]):
             )
 
         for order in orders.orders:
-            db_product = ProductCrud().get_by_id(
-                db=db, product_id=order.product_id
+            db_product = await crud_product.get_by_id(
+                db=db,
+                product_id=order.product_id,
+                options=PRODUCT_STOCK_OPTIONS,
             )
             self.verify_product_stock(
                 product=db_product, quantity=order.quantity
             )
 
-            db_order.sqlmodel_update(
+            await db_order.sqlmodel_update(
                 order.model_dump(exclude_unset=True)
-            ).save(db=db)
+            ).save(db=db, refresh=False)
 
-            self.update_product_stock(
-                db=db, product=db_product, quantity=order.quantity
+            await self.update_product_stock(
+                db=db, product_id=order.product_id, quantity=order.quantity
             )
 
         return db_order
@@ -1,19 +1,46 @@
 from uuid import UUID
 
+import sqlalchemy as sa
 from fastapi import HTTPException, status
-from sqlmodel import Session, select
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app import schemas, utils
+from app import schemas
 from app.core.settings import settings
-from app.crud.base import APICrudBase
+from app.crud.base import APICrudBase, paginate
 from app.db import models
 
+PRODUCT_OWNER_QUERY = select(models.Product.product_owner_id).where(
+    models.Product.product_id == sa.bindparam("product_id")
+)
+PRODUCT_IMAGE_PATHS_QUERY = select(models.Image.file_path).where(
+    models.Image.product_id == sa.bindparam("product_id")
+)
+# the given image paths that are already attached to a product
+ATTACHED_IMAGE_PATHS_QUERY = select(models.Image.file_path).where(
+    models.Image.file_path.in_(sa.bindparam("file_paths", expanding=True))
+)
+# nothing these delete is loaded in the session, so it isn't searched
+DELETE_PRODUCT_STATEMENTS = tuple(
+    sa.delete(model)
+    .where(model.product_id == sa.bindparam("product_id"))
+    .execution_options(synchronize_session=False)
+    for model in (models.Image, models.Order, models.Product)
+)
+
 
 class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
     """
     CRUD operations for managing products.
     """
 
+    load_options = (
+        selectinload(models.Product.orders),
+        joinedload(models.Product.product_owner),
+        selectinload(models.Product.images),
+    )
+
     def __init__(self, model: models.Product = models.Product):
         """
         Initialize the ProductCrud class.
@@ -24,10 +51,10 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
         """
         super().__init__(model)
 
-    def create(
+    async def create(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         product: schemas.ProductCreate,
         image_paths: list[str],
     ) -> models.Product:
@@ -35,23 +62,24 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
         Create a new product.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             product (schemas.ProductCreate): The product data to create.
             image_paths (list[str]): The paths of the product images.
 
         Returns:
             models.Product: The created product.
         """
-        db_product = super().create(db=db, schema=product)
-
-        return self.add_product_images_to_database(
+        db_product = await super().create(db=db, schema=product)
+        await self.add_product_images_to_database(
             image_paths=image_paths, db_product=db_product, db=db
         )
 
-    def update(
+        return await self.get_by_id(db=db, product_id=db_product.product_id)
+
+    async def update(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         product_id: UUID,
         product: schemas.ProductUpdate,
         image_paths: list[str],
@@ -60,7 +88,7 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
         Update an existing product.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             product_id (UUID): The ID of the product to update.
             product (schemas.ProductUpdate): The updated product data.
             image_paths (list[str]): The paths of the updated product images.
@@ -69,7 +97,7 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
             models.Product: The updated product.
         """
         # update the user data
-        db_product = self.get_by_id(db=db, product_id=product_id)
+        db_product = await self.get_by_id(db=db, product_id=product_id)
 
         # verify the user is the owner of the product
         if product.product_owner_id != db_product.product_owner_id:
@@ -77,20 +105,23 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
                 detail="You are not authorized to update this product",
                 status_code=status.HTTP_403_FORBIDDEN,
             )
-        db_product.sqlmodel_update(
+        await db_product.sqlmodel_update(
             product.model_dump(exclude_unset=True)
         ).save(db=db)
 
         if image_paths:
-            return self.add_product_images_to_database(
+            await self.add_product_images_to_database(
                 image_paths=image_paths, db_product=db_product, db=db
             )
-        else:
-            return db_product
+
+        return await self.get_by_id(db=db, product_id=product_id)
 
     @staticmethod
-    def add_product_images_to_database(
-        *, image_paths: list[str], db_product: models.Product, db: Session
+    async def add_product_images_to_database(
+        *,
+        image_paths: list[str],
+        db_product: models.Product,
+        db: AsyncSession,
     ) -> models.Product:
         """
         Add product images to the database.
@@ -99,101 +130,178 @@ class ProductCrud(APICrudBase[models.Product, schemas.ProductBase]):
             image_paths (list[str]): The paths of the product images.
             db_product (models.Product): The product to associate the images
             with.
-            db (Session): The database session.
+            db (AsyncSession): The database session.
         """
-        for path in image_paths:
-            db_image = models.Image(
-                file_path=path, product_id=db_product.product_id
-            )
-            db.add(db_image)
-        db.commit()
-        db.refresh(db_product)
+        await models.Image.bulk_create(
+            [
+                {"file_path": path, "product_id": db_product.product_id}
+                for path in image_paths
+            ],
+            db=db,
+        )
+
         return db_product
 
-    def get_by_id(self, *, db: Session, product_id: str) -> models.Product:
+    @staticmethod
+    async def get_attached_image_paths(
+        *, db: AsyncSession, image_paths: list[str]
+    ) -> list[str]:
+        """
+        Returns the given image paths that are already used by a product.
+
+        Args:
+            db (AsyncSession): The database session.
+            image_paths (list[str]): The image paths to check.
+
+        Returns:
+            list[str]: The paths attached to a product.
+        """
+        if not image_paths:
+            return []
+
+        return (
+            await db.exec(
+                ATTACHED_IMAGE_PATHS_QUERY, params={"file_paths": image_paths}
+            )
+        ).all()
+
+    async def get_by_id(
+        self, *, db: AsyncSession, product_id: str, options=None
+    ) -> models.Product:
         """
         Get a product by its ID.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             product_id (str): The ID of the product.
+            options: The loader options to use instead of `load_options`.
 
         Returns:
             models.Product: The product with the specified ID.
         """
-        return super().get_by_id(db=db, obj_id=product_id)
+        return await super().get_by_id(
+            db=db, obj_id=product_id, options=options
+        )
 
-    def get_all(
+    async def get_all(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         skip: int = 0,
         limit: int = settings.pagination_default_page,
+        after: UUID | None = None,
     ) -> list[models.Product]:
         """
         Get all products.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
+            skip (int): The number of products to skip.
+            limit (int): The maximum number of products to retrieve.
+            after (UUID | None): The ID of the last product of the previous
+            page.
 
         Returns:
             list[models.Product]: A list of all products.
         """
-        return super().get_all(db=db, skip=skip, limit=limit)
+        return await super().get_all(
+            db=db, skip=skip, limit=limit, after=after
+        )
 
-    def delete(
-        self, *, db: Session, product_id: str, owner_id: str
-    ) -> models.Product:
+    async def delete(
+        self, *, db: AsyncSession, product_id: str, owner_id: str
+    ) -> list[str]:
         """
         Delete a product and it's related objects.
 
+        The images and orders of the product are deleted with one statement
+        each, in the same transaction as the product. The image files are
+        left for the caller to remove once that transaction is committed.
+
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             product_id (str): The ID of the product to delete.
             owner_id (str): The ID of the product owner.
 
         Returns:
-            models.Product: The deleted product.
+            list[str]: The paths of the deleted product's image files.
 
         Raises:
-            HTTPException: If the user is not authorized to delete the product.
+            HTTPException: If the product is not found or the user is not
+            authorized to delete it.
         """
-        db_product = self.get_by_id(db=db, product_id=product_id)
-        if owner_id != db_product.product_owner_id:
+        params = {"product_id": product_id}
+        product_owner_id = (
+            await db.exec(PRODUCT_OWNER_QUERY, params=params)
+        ).first()
+        if product_owner_id is None:
+            raise self.not_found_error
+
+        if owner_id != product_owner_id:
             raise HTTPException(
                 detail="You are not authorized to delete this product",
                 status_code=status.HTTP_403_FORBIDDEN,
             )
 
-        images = db.exec(
-            select(models.Image).where(models.Image.product_id == product_id)
+        image_paths = (
+            await db.exec(PRODUCT_IMAGE_PATHS_QUERY, params=params)
         ).all()
 
-        for image in images:
-            utils.delete_image(image.file_path)
-            image.delete(db=db)
-
-        # delete related orders
-        for order in db_product.orders:
-            order.delete(db=db)
+        for statement in DELETE_PRODUCT_STATEMENTS:
+            await db.exec(statement, params=params)
 
-        db_product.delete(db=db)
+        return image_paths
 
-    def get_orders(
-        self, *, db: Session, product_id: str
-    ) -> list[models.Order]:
+    async def get_orders(
+        self,
+        *,
+        db: AsyncSession,
+        product_id: str,
+        skip: int = 0,
+        limit: int = settings.pagination_default_page,
+        after: UUID | None = None,
+    ) -> list[schemas.Order]:
         """
-        Get all orders for a product.
+        Get the orders for a product.
+
+        Only the columns shown in order listings are selected, and the rows
+        are used as-is since the database has already validated them.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             product_id (str): The ID of the product.
+            skip (int): The number of orders to skip.
+            limit (int): The maximum number of orders to retrieve.
+            after (UUID | None): The ID of the last order of the previous
+            page.
 
         Returns:
-            list[models.Order]: A list of orders for the product.
+            list[schemas.Order]: A list of orders for the product.
+
+        Raises:
+            HTTPException: If the product is not found.
         """
-        db_product = self.get_by_id(db=db, product_id=product_id)
-        return db_product.orders
+        limit = min(limit, settings.pagination_limit)
+        query = select(
+            models.Order.order_id,
+            models.Order.product_id,
+            models.Order.created_at,
+            models.Order.updated_at,
+        ).where(models.Order.product_id == product_id)
+        query = paginate(
+            query, models.Order, skip=skip, limit=limit, after=after
+        )
+
+        # an EXISTS query is cheaper than loading the row to raise the 404
+        if not await self.exists(db=db, obj_id=product_id):
+            raise self.not_found_error
+
+        orders = await db.exec(query)
+
+        return [
+            schemas.Order.model_construct(**row._mapping)
+            for row in orders.all()
+        ]
 
 
 crud_product = ProductCrud()
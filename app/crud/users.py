@@ -1,12 +1,28 @@
+from uuid import UUID
+
 from fastapi import HTTPException, status
+from sqlalchemy import bindparam
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import schemas
 from app.core.settings import settings
-from app.crud.base import APICrudBase
+from app.crud.base import APICrudBase, paginate
 from app.db import models
 
+USER_BY_USERNAME_QUERY = select(models.User).where(
+    models.User.username == bindparam("username")
+)
+USER_BY_EMAIL_QUERY = select(models.User).where(
+    models.User.email == bindparam("email")
+)
+# the product columns shown in a user's product listing
+USER_PRODUCT_COLUMNS = [
+    getattr(models.Product, field)
+    for field in schemas.ProductInUserResponse.model_fields
+]
+
 
 class UserCrud(APICrudBase[models.User, schemas.User]):
     """
@@ -28,13 +44,15 @@ class UserCrud(APICrudBase[models.User, schemas.User]):
         """
         super().__init__(model)
 
-    def get_by_username(self, *, username: str, db: Session) -> models.User:
+    async def get_by_username(
+        self, *, username: str, db: AsyncSession
+    ) -> models.User:
         """
         Get a user by username.
 
         Args:
             username (str): The username of the user.
-            db (Session): The database session.
+            db (AsyncSession): The database session.
 
         Returns:
             models.User: The user with the specified username.
@@ -42,20 +60,24 @@ class UserCrud(APICrudBase[models.User, schemas.User]):
         Raises:
             HTTPException: Error 404 if the user is not found.
         """
-        if user := db.exec(
-            select(models.User).where(models.User.username == username)
+        if user := (
+            await db.exec(
+                USER_BY_USERNAME_QUERY, params={"username": username}
+            )
         ).first():
             return user
 
         raise self.not_found_error
 
-    def get_by_email(self, *, email: str, db: Session) -> models.User:
+    async def get_by_email(
+        self, *, email: str, db: AsyncSession
+    ) -> models.User:
         """
         Get a user by email.
 
         Args:
             email (str): The email of the user.
-            db (Session): The database session.
+            db (AsyncSession): The database session.
 
         Returns:
             models.User: The user with the specified email.
@@ -63,24 +85,24 @@ class UserCrud(APICrudBase[models.User, schemas.User]):
         Raises:
             self.not_found_error: If the user is not found.
         """
-        if user := db.exec(
-            select(models.User).where(models.User.email == email)
+        if user := (
+            await db.exec(USER_BY_EMAIL_QUERY, params={"email": email})
         ).first():
             return user
 
         raise self.not_found_error
 
-    def create(
+    async def create(
         self,
         *,
-        db: Session,
+        db: AsyncSession,
         user: schemas.UserCreate,
     ) -> models.User:
         """
         Create a new user.
 
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             user (schemas.UserCreate): The user data to create.
 
         Returns:
@@ -90,7 +112,7 @@ class UserCrud(APICrudBase[models.User, schemas.User]):
             HTTPException: If the user already exists.
         """
         try:
-            db_user = super().create(db=db, schema=user)
+            db_user = await super().create(db=db, schema=user)
         except IntegrityError as e:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -99,91 +121,99 @@ class UserCrud(APICrudBase[models.User, schemas.User]):
         else:
             return db_user
 
-    def get_orders(
+    async def get_orders(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: str,
         skip: int = 0,
         limit: int = settings.pagination_limit,
-    ) -> list[models.Order]:
+        after: UUID | None = None,
+    ) -> list[schemas.OrderInUserResponse]:
         """
         Get the orders of a user.
 
+        Only the columns shown in the user's order listing are selected, and
+        the rows are used as-is since the database has already validated them.
+
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             user_id (str): The ID of the user.
             skip (int, optional): The number of orders to skip. Defaults to 0.
             limit (int, optional): The maximum number of orders to retrieve.
             Defaults to settings.pagination_limit.
+            after (UUID, optional): The ID of the last order of the previous
+            page.
 
         Returns:
-            list[models.Order]: The orders of the user.
+            list[schemas.OrderInUserResponse]: The orders of the user.
         """
         limit = min(limit, settings.pagination_limit)
-        user = self.get_by_id(db=db, obj_id=user_id)
-        return user.orders[skip : skip + limit]  # noqa: E203
-
-    def get_products(
+        query = select(
+            models.Order.order_id,
+            models.Order.product_id,
+            models.Order.quantity,
+        ).where(models.Order.user_id == user_id)
+        query = paginate(
+            query, models.Order, skip=skip, limit=limit, after=after
+        )
+
+        # an EXISTS query is cheaper than loading the row to raise the 404
+        if not await self.exists(db=db, obj_id=user_id):
+            raise self.not_found_error
+
+        rows = (await db.exec(query)).all()
+
+        return [
+            schemas.OrderInUserResponse.model_construct(**row._mapping)
+            for row in rows
+        ]
+
+    async def get_products(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: str,
         skip: int = 0,
         limit: int = settings.pagination_default_page,
-    ) -> list[models.Product]:
+        after: UUID | None = None,
+    ) -> list[schemas.ProductInUserResponse]:
         """
         Get the products of a user.
 
+        Only the columns shown in the listing are selected, and the rows are
+        not validated again since the database has already validated them.
+
         Args:
-            db (Session): The database session.
+            db (AsyncSession): The database session.
             user_id (str): The ID of the user.
             skip (int, optional): The number of products to skip.
             Defaults to 0.
             limit (int, optional): The maximum number of products to retrieve.
             Defaults to settings.pagination_limit.
+            after (UUID, optional): The ID of the last product of the previous
+            page.
 
         Returns:
-            list[models.Product]: The products of the user.
+            list[schemas.ProductInUserResponse]: The products of the user.
         """
         limit = min(limit, settings.pagination_limit)
-        user = self.get_by_id(db=db, obj_id=user_id)
-        return user.products[skip : skip + limit]  # noqa: E203
-
-    def __get_user(
-        self, *, by: str, identifier: str, db: Session
-    ) -> models.User:
-        """
-        Retrieves a user by their ID or username.
-
-        Args:
-            by (str): The type of data to use for the search.
-            identifier (str): A unique value that identifiers a user.
-            db (Session): The database session instance.
-
-        Raises:
-            HTTPException: Error 404 is raised if the user does not exist.
-            Error 500 is raised if the search type is not recognized.
-
-        Returns:
-            models.User: The user with the requested ID or username.
-        """
-        match by:
-            case "id":
-                return self.get_by_id(obj_id=identifier, db=db)
-            case "username":
-                return self.get_by_username(username=identifier, db=db)
-            case "email":
-                return self.get_by_email(email=identifier, db=db)
-            case _:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail={
-                        "message": "An error while performing this action",
-                        "next_steps": "If the error persists, please contact "
-                        "the system administrator.",
-                    },
-                )
-
-    get = __get_user
+        query = select(*USER_PRODUCT_COLUMNS).where(
+            models.Product.product_owner_id == user_id
+        )
+        query = paginate(
+            query, models.Product, skip=skip, limit=limit, after=after
+        )
+
+        # an EXISTS query is cheaper than loading the row to raise the 404
+        if not await self.exists(db=db, obj_id=user_id):
+            raise self.not_found_error
+
+        products = await db.exec(query)
+
+        # converts the stored decimal prices to numbers like other listings
+        return [
+            schemas.construct_from(schemas.ProductInUserResponse, row)
+            for row in products.all()
+        ]
 
 
 crud_user = UserCrud()
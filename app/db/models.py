@@ -3,37 +3,73 @@ from uuid import UUID, uuid4
 
 import sqlalchemy as sa
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, Session, SQLModel
+from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid_utils.compat import uuid7
 
 from app import utils
 from app.db import session
 
+# async sessions cannot lazy load, so relationships are loaded explicitly with
+# the query options in app.crud and any accidental lazy load raises instead.
+RAISE_ON_LAZY_LOAD = {"lazy": "raise"}
+
+
+def utc_now() -> datetime:
+    """Returns the current time in UTC."""
+    return datetime.now(timezone.utc)
+
 
 class Timestamp(SQLModel):
+    # the database fills these in for rows inserted without the ORM
     created_at: datetime = Field(
-        default=datetime.now(timezone.utc),
-        sa_column_kwargs={"nullable": False},
+        default_factory=utc_now,
+        sa_type=sa.DateTime(timezone=True),
+        sa_column_kwargs={"server_default": sa.func.now(), "nullable": False},
     )
     updated_at: datetime = Field(
-        default=datetime.now(timezone.utc),
+        default_factory=utc_now,
+        sa_type=sa.DateTime(timezone=True),
         sa_column_kwargs={
-            "onupdate": datetime.now(timezone.utc),
+            "server_default": sa.func.now(),
+            "onupdate": sa.func.now(),
             "nullable": False,
         },
     )
 
 
 class BaseModel(Timestamp):
-    def save(self, *, db: Session, created: bool = False):
-        """Saves the current object to the database."""
+    async def save(
+        self, *, db: AsyncSession, created: bool = False, refresh: bool = True
+    ):
+        """
+        Saves the current object to the database.
+
+        The object is only flushed; it is committed with the rest of the
+        request's changes when the request ends.
+        """
         self.updated_at = (
-            self.created_at if created else datetime.now(timezone.utc)
+            self.created_at if created else utc_now()
         )
-        return session.save(self, db=db)
-
-    def delete(self, *, db: Session):
+        return await session.save(self, db=db, refresh=refresh)
+
+    @classmethod
+    async def bulk_create(cls, rows: list[dict], *, db: AsyncSession):
+        """
+        Creates an object for each of the rows with a single insert.
+
+        The objects are only inserted; they are committed with the rest of
+        the request's changes when the request ends.
+        """
+        now = utc_now()
+        rows = [
+            {"created_at": now, "updated_at": now, **row} for row in rows
+        ]
+        return await session.bulk_save(cls, rows, db=db)
+
+    async def delete(self, *, db: AsyncSession):
         """Deletes the current object from the database."""
-        session.delete(self, db=db)
+        await session.delete(self, db=db)
 
 
 class User(BaseModel, table=True):
@@ -41,10 +77,17 @@ class User(BaseModel, table=True):
     is_active: bool = True
     role: str
     username: str = Field(max_length=30, index=True, unique=True)
-    user_id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
+    # primary keys are time ordered (UUIDv7), so new rows are added at the end
+    # of their index instead of at random pages across it
+    user_id: UUID = Field(default_factory=uuid7, primary_key=True)
     password: str
-    orders: list["Order"] = Relationship(back_populates="order_owner")
-    products: list["Product"] = Relationship(back_populates="product_owner")
+    orders: list["Order"] = Relationship(
+        back_populates="order_owner", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
+    products: list["Product"] = Relationship(
+        back_populates="product_owner",
+        sa_relationship_kwargs=RAISE_ON_LAZY_LOAD,
+    )
 
     def __repr__(self):
         return f"User {self.username}"
@@ -52,10 +95,16 @@ class User(BaseModel, table=True):
     def __str__(self):
         return self.username
 
-    # hash the password before saving it
-    def save(self, *, db: Session, created: bool = False):
-        self.password = utils.hash_password(password=self.password)
-        return super().save(db=db, created=created)
+    # hash the password before saving a new user; saving an existing user
+    # must not hash the stored hash again
+    async def save(
+        self, *, db: AsyncSession, created: bool = False, refresh: bool = True
+    ):
+        if created:
+            self.password = await utils.hash_password_in_thread(
+                password=self.password
+            )
+        return await super().save(db=db, created=created, refresh=refresh)
 
 
 class Product(BaseModel, table=True):
@@ -77,6 +126,16 @@ class Product(BaseModel, table=True):
         images (list[Image]): The list of images associated with the product.
     """
 
+    # serves a seller's products, newest first, in the order they're paged
+    __table_args__ = (
+        sa.Index(
+            "ix_product_owner_created",
+            "product_owner_id",
+            "created_at",
+            "product_id",
+        ),
+    )
+
     description: str
     name: str
     in_stock: bool
@@ -88,13 +147,17 @@ class Product(BaseModel, table=True):
             nullable=False,
         )
     )
-    product_id: UUID = Field(
-        default_factory=uuid4, primary_key=True, index=True
-    )
+    product_id: UUID = Field(default_factory=uuid7, primary_key=True)
 
-    orders: list["Order"] = Relationship(back_populates="products")
-    product_owner: "User" = Relationship(back_populates="products")
-    images: list["Image"] = Relationship(back_populates="product")
+    orders: list["Order"] = Relationship(
+        back_populates="products", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
+    product_owner: "User" = Relationship(
+        back_populates="products", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
+    images: list["Image"] = Relationship(
+        back_populates="product", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -120,14 +183,21 @@ class Order(BaseModel, table=True):
         order_owner (User): The user who owns the order.
     """
 
-    order_id: UUID = Field(
-        default_factory=uuid4, primary_key=True, index=True
+    # serves a user's orders, newest first, in the order they're paged; it
+    # also covers lookups by user_id alone
+    __table_args__ = (
+        sa.Index(
+            "ix_order_user_created", "user_id", "created_at", "order_id"
+        ),
     )
+
+    order_id: UUID = Field(default_factory=uuid7, primary_key=True)
     product_id: UUID = Field(
         sa_column=sa.Column(
             sa.ForeignKey("product.product_id", ondelete="CASCADE"),
             nullable=False,
             default=uuid4,
+            index=True,
         )
     )
     user_id: UUID = Field(
@@ -137,8 +207,12 @@ class Order(BaseModel, table=True):
         ),
     )
     quantity: int = Field(default=1, description="The number of items")
-    products: list["Product"] = Relationship(back_populates="orders")
-    order_owner: "User" = Relationship(back_populates="orders")
+    products: list["Product"] = Relationship(
+        back_populates="orders", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
+    order_owner: "User" = Relationship(
+        back_populates="orders", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
 
     def __str__(self) -> str:
         return f"Order {self.order_id}"
@@ -158,17 +232,20 @@ class Image(BaseModel, table=True):
         product (Product): The associated product object.
     """
     image_id: UUID = Field(
-        default_factory=uuid4,
+        default_factory=uuid7,
         description="The image's ID.",
         primary_key=True,
-        index=True,
     )
-    file_path: str
+    # an image belongs to one product, so deleting it can't remove another's
+    file_path: str = Field(unique=True, index=True)
     product_id: UUID = Field(
         sa_column=sa.Column(
             sa.ForeignKey("product.product_id", ondelete="CASCADE"),
             nullable=False,
+            index=True,
         )
     )
 
-    product: "Product" = Relationship(back_populates="images")
+    product: "Product" = Relationship(
+        back_populates="images", sa_relationship_kwargs=RAISE_ON_LAZY_LOAD
+    )
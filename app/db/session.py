@@ -1,30 +1,117 @@
-from sqlmodel import Session, create_engine
+import sqlalchemy as sa
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.settings import settings
 
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str):
+    """Returns the database URL using the async driver for its backend."""
+    url = make_url(database_url)
+    if driver := ASYNC_DRIVERS.get(url.get_backend_name()):
+        return url.set(drivername=driver)
+
+    return url
+
+
 if settings.database_type == "sqlite":
-    engine = create_engine(
-        settings.database_url, connect_args={"check_same_thread": False}
+    database_url = get_async_database_url(settings.database_url)
+    pool_options = {}
+    if database_url.database in (None, "", ":memory:"):
+        # an in-memory database only lives as long as its one connection
+        pool_options["poolclass"] = StaticPool
+
+    engine = create_async_engine(
+        database_url,
+        connect_args={"check_same_thread": False},
+        **pool_options,
     )
 else:
-    engine = create_engine(settings.database_url)
+    # connections are reused across requests so each one doesn't pay for a
+    # new handshake; see the README for running PgBouncer in front of this.
+    engine = create_async_engine(
+        get_async_database_url(settings.database_url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
+
+AsyncSessionLocal = async_sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False
+)
+
 
+async def get_async_session():
+    """
+    Yields the session of a request, committing it when the request succeeds.
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+    Saves only flush their changes, so everything a request writes reaches
+    the disk in one commit; if the request fails it is all rolled back.
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
 
 
-def save(model_instance, *, db: Session):
-    """Saves an instance of any object to the database."""
+def get_parallel_session(db: AsyncSession) -> AsyncSession:
+    """
+    Returns a new session using the same engine as the given session.
+
+    A session runs one query at a time, so a query meant to run concurrently
+    with the given session's needs a session (and connection) of its own.
+    """
+    return AsyncSession(db.bind, expire_on_commit=False)
+
+
+async def save(model_instance, *, db: AsyncSession, refresh: bool = True):
+    """
+    Saves an instance of any object to the database.
+
+    The changes are only flushed, so they are not durable until the session
+    is committed at the end of the request (see `get_async_session`). With
+    `refresh=False` the instance is not reloaded after the flush.
+    """
     db.add(model_instance)
-    db.commit()
-    db.refresh(model_instance)
+    await db.flush()
+    if refresh:
+        await db.refresh(model_instance)
 
     return model_instance
 
 
-def delete(model_instance, *, db: Session):
+async def bulk_save(model_cls, rows: list[dict], *, db: AsyncSession):
+    """
+    Inserts many rows of a model in one statement.
+
+    Unlike calling `save` for each row, this costs a single round trip for
+    the insert and none for refreshing, since the rows come back from the
+    insert itself. Like `save`, it doesn't commit: the rows are committed
+    with the rest of the request's changes (see `get_async_session`).
+    """
+    if not rows:
+        return []
+
+    return (
+        await db.scalars(sa.insert(model_cls).returning(model_cls), rows)
+    ).all()
+
+
+async def delete(model_instance, *, db: AsyncSession):
     """Delete an instance of an object from the database."""
-    db.delete(model_instance)
-    db.commit()
+    await db.delete(model_instance)
+    await db.flush()
@@ -1,10 +1,17 @@
-from fastapi import FastAPI, status
+import hashlib
+from contextlib import asynccontextmanager
+from functools import cache
+
+from anyio import to_thread
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, ORJSONResponse, RedirectResponse
 
 from app import schemas
 from app.api.main import api_router
+from app.core.cache import init_cache
 from app.core.settings import settings
+from app.db.session import engine
 
 description = """
 TinyCart API is a simple mini-shop API. It allows you to manage users,
@@ -24,6 +31,55 @@ if settings.dev:
 else:
     servers = [{"url": settings.prod_url, "description": "Production server"}]
 
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+STATUS_CACHE_CONTROL = "public, max-age=60"
+
+
+@cache
+def get_file_etag(path: str) -> str:
+    """Returns the ETag of a static file, hashing it the first time."""
+    with open(path, "rb") as file:
+        digest = hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+    return f'"{digest}"'
+
+
+def static_file_response(path: str, request: Request) -> Response:
+    """
+    Serves a static file that browsers may cache and revalidate.
+
+    Args:
+        path: The path of the file.
+        request: The request for the file.
+
+    Returns:
+        Response: The file, or an empty 304 response when the client's copy
+        is current.
+    """
+    headers = {
+        "Cache-Control": STATIC_CACHE_CONTROL,
+        "ETag": get_file_etag(path),
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+
+    return FileResponse(path, headers=headers)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Configures the application on startup and cleans up on shutdown."""
+    # password hashing and file I/O run in worker threads
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.worker_threads
+    init_cache()
+    get_file_etag(settings.api_schema_filepath)
+    yield
+    await engine.dispose()
+
 
 app = FastAPI(
     title="TinyCart API",
@@ -37,6 +93,8 @@ app = FastAPI(
     docs_url=f"/api/{settings.api_version}/docs" if settings.dev else None,
     redoc_url=f"/api/{settings.api_version}/redoc" if settings.dev else None,
     servers=servers,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -51,9 +109,8 @@ app.add_middleware(
 
 
 @api_router.get("/schema", include_in_schema=False)
-def get_api_schema():
-    print("using this")
-    return FileResponse(settings.api_schema_filepath)
+async def get_api_schema(request: Request):
+    return static_file_response(settings.api_schema_filepath, request)
 
 
 @api_router.get("/docs", include_in_schema=False)
@@ -64,24 +121,27 @@ async def get_docs():
     )
 
 
+# the status doesn't change while the app runs, so it is serialized once
+STATUS_CONTENT = schemas.StatusResponse.serialize(
+    schemas.Status(
+        status="OK", version=app.version, title=app.title, servers=servers
+    ),
+    message=f"{app.title} is running",
+)
+
+
 @api_router.get(
     "/status/",
     tags=["status"],
-    response_model=schemas.StatusResponse,
+    response_model=None,
+    responses={status.HTTP_200_OK: {"model": schemas.StatusResponse}},
     summary="API Status",
 )
 async def get_api_status():
     """Check the API status."""
-    return {
-        "data": {
-            "status": "OK",
-            "version": app.version,
-            "title": app.title,
-            "servers": servers,
-        },
-        "message": f"{app.title} is running",
-        "status_code": 200,
-    }
+    return ORJSONResponse(
+        STATUS_CONTENT, headers={"Cache-Control": STATUS_CACHE_CONTROL}
+    )
 
 
 app.include_router(api_router)
@@ -1,20 +1,31 @@
 from __future__ import annotations
 
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
-from typing import Generic, TypeVar
+from types import NoneType, UnionType
+from typing import ClassVar, Generic, TypeVar, Union, get_args, get_origin
 from uuid import UUID
 
 from fastapi import status
-from pydantic import UUID4, EmailStr, HttpUrl, model_validator
+from pydantic import (
+    ConfigDict,
+    EmailStr,
+    HttpUrl,
+    computed_field,
+    model_validator,
+)
 from sqlmodel import Field, SQLModel
 
-import app
-import app.main
+from app.core.settings import settings
 from app.db import models
 
 ResponseModel = TypeVar("ResponseModel")
 
+# the same server URL the API documents in app.main
+SERVER_URL = "http://localhost:8000" if settings.dev else settings.prod_url
+PRODUCT_URL_BASE = f"{SERVER_URL}/api/{settings.api_version}/products/"
+
 
 class BaseResponse(SQLModel, Generic[ResponseModel]):
     message: str
@@ -25,6 +36,14 @@ class BaseResponse(SQLModel, Generic[ResponseModel]):
         default=None, description="The number of items.", exclude=True
     )
     data: ResponseModel
+    # whether the data is a list, worked out once per response class
+    data_is_list: ClassVar[bool] = False
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        super().__pydantic_init_subclass__(**kwargs)
+        data_annotation = cls.model_fields["data"].annotation
+        cls.data_is_list = get_origin(data_annotation) is list
 
     @model_validator(mode="before")
     @classmethod
@@ -38,11 +57,124 @@ class BaseResponse(SQLModel, Generic[ResponseModel]):
         Returns:
             dict: The updated values with the correct count.
         """
-        if "data" in values and isinstance(values["data"], list):
+        if not cls.data_is_list or values.get("count") is not None:
+            return values
+
+        if isinstance(values.get("data"), list):
             values["count"] = len(values["data"])
 
         return values
 
+    @classmethod
+    def serialize(cls, data, **fields) -> dict:
+        """
+        Serializes already validated data into the response's JSON content.
+
+        This skips validating the data a second time, which FastAPI would do
+        when the response model is applied to the endpoint's return value.
+
+        Args:
+            data: The validated response data.
+            **fields: The values of the response's other fields.
+
+        Returns:
+            dict: The JSON-compatible response content.
+        """
+        # `compute_count` only runs on validation
+        if cls.data_is_list:
+            fields.setdefault("count", len(data))
+
+        # URL fields may be built as plain strings, which serialize the same
+        return cls.model_construct(data=data, **fields).model_dump(
+            mode="json", warnings=False
+        )
+
+    @classmethod
+    def dump(cls, data, **fields) -> dict:
+        """
+        Converts database objects into the response's JSON content.
+
+        The objects were validated when they were saved, so the response data
+        is built from them without validating it again.
+
+        Args:
+            data: The response data, such as database objects.
+            **fields: The values of the response's other fields.
+
+        Returns:
+            dict: The JSON-compatible response content.
+        """
+        data = construct_trusted(cls.model_fields["data"].annotation, data)
+        return cls.serialize(data, **fields)
+
+
+def construct_trusted(annotation, value):
+    """
+    Converts a trusted value, such as a database object, into the given type
+    without validating it.
+
+    Args:
+        annotation: The type of the field the value is for.
+        value: The value to convert.
+
+    Returns:
+        The converted value.
+    """
+    if value is None:
+        return None
+
+    origin = get_origin(annotation)
+    if origin is list:
+        (item_type,) = get_args(annotation)
+        return [construct_trusted(item_type, item) for item in value]
+
+    if origin in (Union, UnionType):
+        (annotation,) = (
+            arg for arg in get_args(annotation) if arg is not NoneType
+        )
+        return construct_trusted(annotation, value)
+
+    # prices are stored as decimals but served as numbers
+    if annotation is float and isinstance(value, Decimal):
+        return float(value)
+
+    if (
+        isinstance(annotation, type)
+        and issubclass(annotation, SQLModel)
+        and not isinstance(value, annotation)
+    ):
+        return construct_from(annotation, value)
+
+    return value
+
+
+def construct_from(schema: type[SQLModel], obj) -> SQLModel:
+    """
+    Builds a schema from the attributes of a trusted object without
+    validating them.
+
+    Args:
+        schema: The schema to build.
+        obj: The object to read the schema's fields from.
+
+    Returns:
+        The schema instance.
+    """
+    values = {
+        name: construct_trusted(field.annotation, getattr(obj, name))
+        for name, field in schema.model_fields.items()
+        if hasattr(obj, name)
+    }
+    return schema.model_construct(**values)
+
+
+class PaginatedResponse(BaseResponse[ResponseModel], Generic[ResponseModel]):
+    next_cursor: UUID | None = Field(
+        default=None,
+        description="Pass as `after` to retrieve the next page. It is null "
+        "on the last page.",
+    )
+
 
 class UserRoles(str, Enum):
     seller = "seller"
@@ -66,7 +198,7 @@ class ProductCreate(ProductBase):
     Represents the schema for creating a product.
     """
 
-    product_owner_id: UUID4
+    product_owner_id: UUID
 
 
 class ProductUpdate(SQLModel):
@@ -83,7 +215,7 @@ class ProductUpdate(SQLModel):
     )
     unit_price: float | None = None
     number_in_stock: int | None = None
-    product_owner_id: UUID4
+    product_owner_id: UUID
 
 
 class Product(ProductBase, models.Timestamp):
@@ -91,7 +223,10 @@ class Product(ProductBase, models.Timestamp):
     Represents the public schema for a product.
     """
 
-    product_id: UUID4
+    # responses are only ever read, never modified
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    product_id: UUID
     orders: list[OrderInUserResponse]
     product_owner: UserInProductResponse
     images: list[ImageResponse]
@@ -107,7 +242,7 @@ class ProductPublic(BaseResponse[Product]):
     data: Product
 
 
-class ProductsPublic(BaseResponse[Product]):
+class ProductsPublic(PaginatedResponse[Product]):
     """
     Represents a list of public products.
     """
@@ -123,7 +258,7 @@ class ProductInModels(SQLModel):
     Represents the schema for a product used in other models.
     """
 
-    product_id: UUID4
+    product_id: UUID
     name: str
     unit_price: float
 
@@ -179,7 +314,7 @@ class UserPasswordUpdate(SQLModel):
 
 
 class ProductInUserResponse(SQLModel):
-    product_id: UUID4
+    product_id: UUID
     name: str
     description: str
     unit_price: float
@@ -187,7 +322,7 @@ class ProductInUserResponse(SQLModel):
     in_stock: bool
 
 
-class ProductsInUserResponse(BaseResponse[ProductInUserResponse]):
+class ProductsInUserResponse(PaginatedResponse[ProductInUserResponse]):
     message: str = "User products retrieved successfully."
     status_code: int = status.HTTP_200_OK
     count: int
@@ -195,7 +330,9 @@ class ProductsInUserResponse(BaseResponse[ProductInUserResponse]):
 
 
 class User(UserWithTimestamp):
-    user_id: UUID4
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    user_id: UUID
 
     @model_validator(mode="after")
     def remove_products_for_buyer(self):
@@ -217,7 +354,7 @@ class UserPublic(BaseResponse[User]):
     data: User
 
 
-class UsersPublic(BaseResponse[User]):
+class UsersPublic(PaginatedResponse[User]):
     """
     Represents a list of public users.
     """
@@ -232,7 +369,7 @@ class UsersPublic(BaseResponse[User]):
 
 
 class UserInModels(SQLModel):
-    user_id: UUID4
+    user_id: UUID
     username: str
 
 
@@ -259,7 +396,7 @@ class OrderProductCreate(SQLModel):
     """
 
     quantity: int = Field(description="The number of items to order")
-    product_id: UUID4 = Field(description="The ID of the product")
+    product_id: UUID = Field(description="The ID of the product")
 
 
 class OrderCreate(SQLModel):
@@ -279,28 +416,27 @@ class OrderUpdate(OrderCreate):
 
 
 class ProductInOrder(SQLModel):
-    product_id: UUID4
+    product_id: UUID
 
 
-class OrderBase(SQLModel):
-    order_id: UUID4
-    product_url: HttpUrl
+def get_product_url(product_id: UUID) -> str:
+    """Returns the API URL of the product with the given ID."""
+    return f"{PRODUCT_URL_BASE}{product_id}/"
 
-    @model_validator(mode="before")
-    def add_url(self):
-        product_id = self.product_id
-        app_info = app.main.app
 
-        url = (
-            f"{app_info.servers[0].get('url')}/api/{app_info.version}/"
-            f"products/{product_id}/"
-        )
-        self.__dict__["product_url"] = url
-        return self
+class OrderBase(SQLModel):
+    order_id: UUID
+    product_id: UUID = Field(exclude=True)
+
+    @computed_field
+    @property
+    def product_url(self) -> HttpUrl:
+        """The API URL of the ordered product, built when serialized."""
+        return get_product_url(self.product_id)
 
 
 class OrderInUserResponse(OrderBase):
-    order_id: UUID4
+    order_id: UUID
     quantity: int
 
 
@@ -309,6 +445,8 @@ class Order(OrderBase, models.Timestamp):
     Represents the public schema for an order.
     """
 
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
 
 class OrderPublic(BaseResponse[Order]):
     """
@@ -320,7 +458,7 @@ class OrderPublic(BaseResponse[Order]):
     data: Order
 
 
-class OrdersPublic(BaseResponse[Order]):
+class OrdersPublic(PaginatedResponse[Order]):
     """
     Represents a list of public orders.
     """
@@ -330,7 +468,7 @@ class OrdersPublic(BaseResponse[Order]):
     data: list[Order]
 
 
-class OrdersInUserResponse(BaseResponse[OrderInUserResponse]):
+class OrdersInUserResponse(PaginatedResponse[OrderInUserResponse]):
     """
     Represents a list of orders in a user response.
     """
@@ -350,6 +488,27 @@ class ImageResponse(SQLModel):
     image_id: UUID
 
 
+class ImageUpload(SQLModel):
+    """
+    Represents the schema for an uploaded image not yet added to a product.
+    """
+
+    file_path: str = Field(
+        description="Pass in `image_paths` when creating or updating a "
+        "product."
+    )
+
+
+class ImageUploadPublic(BaseResponse[ImageUpload]):
+    """
+    Represents the public schema for an uploaded image.
+    """
+
+    message: str = "Image uploaded successfully."
+    status_code: int = status.HTTP_201_CREATED
+    data: ImageUpload
+
+
 class TokenBase(SQLModel):
     """
     Represents the schema for a token.
@@ -375,7 +534,7 @@ class TokenPayload(SQLModel):
     Represents the payload of a token.
     """
 
-    user_id: UUID4
+    user_id: UUID
     email: EmailStr
 
 
@@ -398,3 +557,8 @@ class StatusResponse(BaseResponse[Status]):
     message: str = "TinyCart API is running."
     status_code: int = status.HTTP_200_OK
     data: Status
+
+
+# resolves the schemas Product refers to before they were defined, which
+# `construct_trusted` reads from its field annotations
+Product.model_rebuild()
@@ -1,34 +1,187 @@
 import contextlib
 import os
-from uuid import uuid4
+import shutil
+from collections.abc import AsyncIterator
+from functools import cache, partial
+from typing import BinaryIO
+from uuid import UUID, uuid4
 
-from fastapi import UploadFile
-from passlib.context import CryptContext
+import aiofiles
+import bcrypt
+from anyio import CapacityLimiter, to_thread
+from fastapi import HTTPException, UploadFile, status
 
-UPLOAD_FOLDER = "uploaded_images"
+from app.core.settings import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+UPLOAD_FOLDER = "uploaded_images"
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
+IMAGE_CONTENT_TYPES = frozenset(
+    {"image/gif", "image/jpeg", "image/png", "image/webp"}
+)
 
 
-def save_image(image: UploadFile) -> str:
+async def save_image(image: UploadFile, *, owner_id: UUID) -> str:
     """
     Saves the uploaded image to the server.
 
+    The image is copied in chunks so memory use does not grow with its size,
+    all in one worker thread rather than a thread hop for every chunk.
+
     Args:
         image (UploadFile): The uploaded image file.
+        owner_id (UUID): The ID of the user uploading the image.
 
     Returns:
         str: The file path where the image is saved.
     """
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    file_path = get_new_image_path(image.filename, owner_id=owner_id)
+    await to_thread.run_sync(copy_to_file, image.file, file_path)
+    return file_path
+
+
+def copy_to_file(source: BinaryIO, file_path: str):
+    """
+    Copies a file object to the given path in chunks.
 
-    filename = f"{uuid4()}_{image.filename.replace(' ', '_')}"
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    Args:
+        source (BinaryIO): The file object to copy.
+        file_path (str): The path to copy it to.
+    """
     with open(file_path, "wb") as buffer:
-        buffer.write(image.file.read())
+        shutil.copyfileobj(source, buffer, UPLOAD_COPY_BUFFER_SIZE)
+
+
+async def save_image_stream(
+    *, filename: str, chunks: AsyncIterator[bytes], owner_id: UUID
+) -> str:
+    """
+    Saves an image sent as a raw request body to the server.
+
+    The chunks are written as they arrive, without being parsed as form data
+    or spooled to a temporary file first. The partly written file is removed
+    if the upload is too large or doesn't complete.
+
+    Args:
+        filename (str): The name the client gave the image.
+        chunks (AsyncIterator[bytes]): The image's content.
+        owner_id (UUID): The ID of the user uploading the image.
+
+    Returns:
+        str: The file path where the image is saved.
+
+    Raises:
+        HTTPException: Error 413 is raised if the image is larger than
+        `settings.max_image_size`.
+    """
+    file_path = get_new_image_path(filename, owner_id=owner_id)
+    size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.max_image_size:
+                    raise get_image_too_large_error()
+                await buffer.write(chunk)
+    except BaseException:
+        # also covers the client disconnecting and the request being cancelled
+        delete_image(file_path)
+        raise
+
     return file_path
 
 
+def get_image_too_large_error() -> HTTPException:
+    """Returns the error raised for images over the size limit."""
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Images can't be larger than {settings.max_image_size} bytes.",
+    )
+
+
+def is_image_content_type(content_type: str | None) -> bool:
+    """
+    Checks that a declared content type is of a supported image format.
+
+    Args:
+        content_type (str | None): The value of a Content-Type header.
+
+    Returns:
+        bool: True if the content type is of an image, False otherwise.
+    """
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return media_type in IMAGE_CONTENT_TYPES
+
+
+def get_upload_folder(owner_id: UUID) -> str:
+    """
+    Returns the folder the images uploaded by a user are saved in.
+
+    Args:
+        owner_id (UUID): The ID of the user.
+
+    Returns:
+        str: The path of the user's upload folder.
+    """
+    return os.path.join(UPLOAD_FOLDER, str(owner_id))
+
+
+def get_new_image_path(filename: str, *, owner_id: UUID) -> str:
+    """
+    Returns a unique path in the user's upload folder for an image.
+
+    Args:
+        filename (str): The name the client gave the image.
+        owner_id (UUID): The ID of the user uploading the image.
+
+    Returns:
+        str: The file path to save the image to.
+    """
+    folder = get_upload_folder(owner_id)
+    os.makedirs(folder, exist_ok=True)
+
+    filename = os.path.basename(filename).replace(" ", "_")
+    return os.path.join(folder, f"{uuid4()}_{filename}")
+
+
+def is_uploaded_image(file_path: str, *, owner_id: UUID) -> bool:
+    """
+    Checks that the path is of an image the user saved in their folder.
+
+    Args:
+        file_path (str): The path to check.
+        owner_id (UUID): The ID of the user.
+
+    Returns:
+        bool: True if the user uploaded the image, False otherwise.
+    """
+    return (
+        os.path.normpath(file_path) == file_path
+        and os.path.dirname(file_path) == get_upload_folder(owner_id)
+        and os.path.isfile(file_path)
+    )
+
+
+async def are_uploaded_images(
+    file_paths: list[str], *, owner_id: UUID
+) -> bool:
+    """
+    Checks that every path is of an image the user saved in their folder.
+
+    The files are looked up in a worker thread, off the event loop.
+
+    Args:
+        file_paths (list[str]): The paths to check.
+        owner_id (UUID): The ID of the user.
+
+    Returns:
+        bool: True if the user uploaded all the images, False otherwise.
+    """
+    is_own_upload = partial(is_uploaded_image, owner_id=owner_id)
+    # the lazy map is consumed by all() in the worker thread
+    return await to_thread.run_sync(all, map(is_own_upload, file_paths))
+
+
 def delete_image(file_path: str):
     """
     Deletes the file at the given file path.
@@ -43,9 +196,65 @@ def delete_image(file_path: str):
         os.remove(file_path)
 
 
+@cache
+def get_password_limiter() -> CapacityLimiter:
+    """
+    Returns the limiter for the threads checking and hashing passwords.
+
+    bcrypt releases the GIL, so its threads already run on every core, but
+    running more hashes than there are cores only makes each one slower and
+    takes threads away from other blocking work.
+    """
+    return CapacityLimiter(os.cpu_count() or 1)
+
+
+def delete_images(file_paths: list[str]):
+    """
+    Deletes the files at the given file paths.
+
+    Args:
+        file_paths (list[str]): The paths of the files to be deleted.
+    """
+    for file_path in file_paths:
+        delete_image(file_path)
+
+
 def hash_password(*, password: str) -> str:
     """
-    Hashes the given password using the pwd_context.
+    Hashes the given password with bcrypt at the configured cost.
+
+    Args:
+        password (str): The password to be hashed.
+
+    Returns:
+        str: The hashed password.
+    """
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Checks whether a password hash was made with another bcrypt cost.
+
+    Args:
+        hashed_password (str): The password hash to check.
+
+    Returns:
+        bool: True if the hash should be replaced, False otherwise.
+    """
+    # bcrypt hashes look like $2b$<cost>$<salt and hash>
+    with contextlib.suppress(IndexError, ValueError):
+        return int(hashed_password.split("$")[2]) != settings.bcrypt_rounds
+
+    return True
+
+
+async def hash_password_in_thread(*, password: str) -> str:
+    """
+    Hashes the given password in a worker thread.
+
+    bcrypt is slow on purpose, so it is kept off the event loop.
 
     Args:
         password (str): The password to be hashed.
@@ -53,4 +262,7 @@ def hash_password(*, password: str) -> str:
     Returns:
         str: The hashed password.
     """
-    return pwd_context.hash(password)
+    return await to_thread.run_sync(
+        partial(hash_password, password=password),
+        limiter=get_password_limiter(),
+    )
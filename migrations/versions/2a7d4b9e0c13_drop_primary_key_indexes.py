@@ -0,0 +1,47 @@
+"""drop primary key indexes
+
+Revision ID: 2a7d4b9e0c13
+Revises: 9c3e6d2a1f57
+Create Date: 2026-10-15 12:08:19.736540
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2a7d4b9e0c13"
+down_revision: Union[str, None] = "9c3e6d2a1f57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the primary key constraints already index these columns
+PRIMARY_KEY_INDEXES = (
+    ("user", "user_id"),
+    ("product", "product_id"),
+    ("order", "order_id"),
+    ("image", "image_id"),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table, column in PRIMARY_KEY_INDEXES:
+            op.drop_index(
+                op.f(f"ix_{table}_{column}"),
+                table_name=table,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table, column in PRIMARY_KEY_INDEXES:
+            op.create_index(
+                op.f(f"ix_{table}_{column}"),
+                table,
+                [column],
+                unique=False,
+                postgresql_concurrently=True,
+            )
@@ -0,0 +1,50 @@
+"""timestamp server defaults
+
+Revision ID: 5f1c9a7e2b84
+Revises: bd0a00cced63
+Create Date: 2026-10-15 10:41:07.552913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5f1c9a7e2b84"
+down_revision: Union[str, None] = "bd0a00cced63"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("user", "product", "order", "image")
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+
+
+def upgrade() -> None:
+    # the existing timestamps were stored in UTC without a time zone
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            for column in TIMESTAMP_COLUMNS:
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.DateTime(),
+                    type_=sa.DateTime(timezone=True),
+                    server_default=sa.func.now(),
+                    existing_nullable=False,
+                    postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+                )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            for column in TIMESTAMP_COLUMNS:
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.DateTime(timezone=True),
+                    type_=sa.DateTime(),
+                    server_default=None,
+                    existing_nullable=False,
+                    postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+                )
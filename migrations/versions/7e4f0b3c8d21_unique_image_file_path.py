@@ -0,0 +1,39 @@
+"""unique image file path
+
+Revision ID: 7e4f0b3c8d21
+Revises: 2a7d4b9e0c13
+Create Date: 2026-10-15 14:02:45.318870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7e4f0b3c8d21"
+down_revision: Union[str, None] = "2a7d4b9e0c13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # built concurrently on PostgreSQL so the table stays writable, which
+    # can't be done inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_image_file_path"),
+            "image",
+            ["file_path"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_image_file_path"),
+            table_name="image",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,76 @@
+"""index owner lookups
+
+Revision ID: 9c3e6d2a1f57
+Revises: 5f1c9a7e2b84
+Create Date: 2026-10-15 11:26:53.104377
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9c3e6d2a1f57"
+down_revision: Union[str, None] = "5f1c9a7e2b84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # built concurrently on PostgreSQL so the tables stay writable, which
+    # can't be done inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_image_product_id"),
+            "image",
+            ["product_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_product_owner_created",
+            "product",
+            ["product_owner_id", "created_at", "product_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_order_user_created",
+            "order",
+            ["user_id", "created_at", "order_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        # the composite index covers lookups by user_id alone
+        op.drop_index(
+            op.f("ix_order_user_id"),
+            table_name="order",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_order_user_id"),
+            "order",
+            ["user_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_order_user_created",
+            table_name="order",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_product_owner_created",
+            table_name="product",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix_image_product_id"),
+            table_name="image",
+            postgresql_concurrently=True,
+        )
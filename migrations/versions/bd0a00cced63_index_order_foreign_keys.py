@@ -0,0 +1,51 @@
+"""index order foreign keys
+
+Revision ID: bd0a00cced63
+Revises: e8a61d4f41af
+Create Date: 2026-10-15 09:12:31.408215
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "bd0a00cced63"
+down_revision: Union[str, None] = "e8a61d4f41af"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # built concurrently on PostgreSQL so the table stays writable, which
+    # can't be done inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f("ix_order_product_id"),
+            "order",
+            ["product_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            op.f("ix_order_user_id"),
+            "order",
+            ["user_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            op.f("ix_order_user_id"),
+            table_name="order",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix_order_product_id"),
+            table_name="order",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,26 @@
+#!/bin/sh
+# Creates the PostgreSQL test database as a copy of a template database.
+#
+# Usage: ./setup_test_db.sh DATABASE_TEST_URL
+#
+# The template is created and migrated on the first run only (keep it
+# around in CI), so every later run copies its files instead of replaying
+# the schema's DDL. Delete the template after adding a migration.
+set -eu
+
+test_url="$1"
+test_db="${test_url##*/}"
+template_db="${test_db}_template"
+server_url="${test_url%/*}/postgres"
+
+template_exists=$(psql "$server_url" -tAc \
+    "SELECT 1 FROM pg_database WHERE datname = '$template_db'")
+if [ -z "$template_exists" ]; then
+    psql "$server_url" -q -v ON_ERROR_STOP=1 \
+        -c "CREATE DATABASE \"$template_db\""
+    DATABASE_URL="${test_url%/*}/$template_db" alembic upgrade head
+fi
+
+psql "$server_url" -q -v ON_ERROR_STOP=1 \
+    -c "DROP DATABASE IF EXISTS \"$test_db\" WITH (FORCE)" \
+    -c "CREATE DATABASE \"$test_db\" TEMPLATE \"$template_db\""
@@ -0,0 +1,12 @@
+#!/bin/sh
+# Drops the PostgreSQL test database, keeping its template for the next run.
+#
+# Usage: ./teardown_test_db.sh DATABASE_TEST_URL
+set -eu
+
+test_url="$1"
+test_db="${test_url##*/}"
+server_url="${test_url%/*}/postgres"
+
+psql "$server_url" -q -v ON_ERROR_STOP=1 \
+    -c "DROP DATABASE IF EXISTS \"$test_db\" WITH (FORCE)"
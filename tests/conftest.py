@@ -1,80 +1,193 @@
 import subprocess
 
 import pytest
+from fastapi_cache import FastAPICache
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy import create_engine
-from sqlmodel import Session, SQLModel
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core import security
+from app.core.cache import init_cache
 from app.core.settings import settings
 from app.db import models
-from app.db.session import get_session
+from app.db.session import get_async_database_url, get_async_session
 from app.main import app
 
 
-@pytest.fixture(scope="package", autouse=True)
+@pytest.fixture(scope="session")
 def setup_teardown_test_db():
-    """Performs setup and teardown for the test database."""
+    """
+    Performs setup and teardown for the test database.
+
+    PostgreSQL test databases are copied from a template by the scripts,
+    while a SQLite test database is a file created when it is connected to.
+    """
+    if settings.database_type == "sqlite":
+        yield
+        return
+
     print("Setting up")
-    subprocess.run(["./setup_test_db.sh"])
+    # a failed setup stops the run instead of failing every test after it
+    subprocess.run(
+        ["./setup_test_db.sh", settings.database_test_url],
+        check=True,
+        capture_output=True,
+    )
 
     yield
 
     print("Tearing down")
-    subprocess.run(["./teardown_test_db.sh"])
+    subprocess.run(
+        ["./teardown_test_db.sh", settings.database_test_url],
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Runs the async tests and fixtures with asyncio, like the app."""
+    return "asyncio"
+
+
+def enable_sqlite_transactions(engine: AsyncEngine) -> None:
+    """
+    Makes SQLite begin transactions when SQLAlchemy does.
+
+    The sqlite3 driver delays BEGIN until the first write and never emits
+    SAVEPOINT, so commits made by the app would stay in the database after
+    the test's transaction is rolled back.
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin_transaction(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="session")
+async def engine(setup_teardown_test_db):
+    """Creates the test database's tables once for the whole test run."""
+
+    engine = create_async_engine(
+        get_async_database_url(settings.database_test_url)
+    )
+    if settings.database_type == "sqlite":
+        enable_sqlite_transactions(engine)
+
+    async with engine.begin() as connection:
+        # a copied template already has the tables, a SQLite file may have
+        # the previous run's rows
+        if settings.database_type == "sqlite":
+            await connection.run_sync(SQLModel.metadata.drop_all)
+        await connection.run_sync(SQLModel.metadata.create_all)
+
+    yield engine
+
+    await engine.dispose()
 
 
 @pytest.fixture
-def session():
-    """Sets up the session for the test database connection."""
+async def session(engine):
+    """
+    Sets up the session for the test database connection.
 
-    engine = create_engine(settings.database_test_url)
+    Each test runs inside a transaction that is rolled back afterwards, so
+    the tables don't need to be recreated between tests. Commits made by the
+    app only release a SAVEPOINT within that transaction.
+    """
 
-    SQLModel.metadata.drop_all(bind=engine)
-    SQLModel.metadata.create_all(bind=engine)
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        session = AsyncSession(
+            bind=connection,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
 
-    with Session(engine) as session:
         yield session
 
+        await session.close()
+        await transaction.rollback()
+
 
 @pytest.fixture
-async def api_client(session: Session):
+async def api_client(session: AsyncSession):
     """Yields a client object to be used for API testing."""
 
-    def override_get_session():
+    async def override_get_session():
         """
         A fixture to override the default database session used in tests.
 
         Explanation:
-        This fixture yields the provided session for testing purposes and
-        ensures that the session is properly closed after the test.
+        This fixture yields the provided session for testing purposes and,
+        like the app, commits it when the request succeeds. The commit only
+        releases a SAVEPOINT, so the test's transaction can still be rolled
+        back.
 
         Returns:
             The database session for testing.
         """
         try:
             yield session
-        finally:
-            session.close()
-
-    app.dependency_overrides[get_session] = override_get_session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+    app.dependency_overrides[get_async_session] = override_get_session
+    # the transport doesn't run the app's lifespan, which sets up the cache
+    init_cache()
     yield AsyncClient(
         base_url="http://testserver", transport=ASGITransport(app=app)
     )
 
+    # responses of rolled back rows must not be served to the next test
+    await FastAPICache.clear()
+
+
+def get_auth_headers(user: models.User) -> dict[str, str]:
+    """Returns the headers authenticating requests as the given user."""
+    access_token, _ = security.create_access_token(
+        data={"sub": str(user.user_id), "email": user.email}
+    )
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+async def create_user(
+    session: AsyncSession, *, username: str, role: str = "seller"
+) -> models.User:
+    """Creates a user named `username` with the password 'my_password'."""
+    user = models.User(
+        email=f"{username}@example.com",
+        username=username,
+        role=role,
+        password="my_password",
+    )
+    return await user.save(db=session, created=True)
+
 
 @pytest.fixture
-def create_jdoe_user(session: Session) -> models.User:
+async def create_jdoe_user(session: AsyncSession) -> models.User:
     """
-    Fixture to create a user with username 'jdoe' and password 'my_password'
-    in the database.
-
-    This fixture creates a user with specific credentials in the database
-    using the provided session.
+    Fixture to create a seller with username 'jdoe' and password
+    'my_password' in the database.
 
     Args:
-        session (Session): The database session to use for creating the user.
+        session (AsyncSession): The database session to create the user with.
 
     Returns:
         models.User: The created user object in the database.
     """
-    pass
+    return await create_user(session, username="jdoe")
+
+
+@pytest.fixture
+def jdoe_headers(create_jdoe_user: models.User) -> dict[str, str]:
+    """Returns the headers authenticating requests as 'jdoe'."""
+    return get_auth_headers(create_jdoe_user)
@@ -0,0 +1,173 @@
+import asyncio
+from uuid import UUID
+
+import pytest
+import sqlalchemy as sa
+from fastapi import HTTPException, status
+from httpx import AsyncClient
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import schemas
+from app.crud.orders import crud_order
+from app.db import models
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_product(
+    session: AsyncSession, *, owner: models.User, number_in_stock: int
+) -> models.Product:
+    """Creates a product of the given user with the given stock."""
+    product = models.Product(
+        name="Notebook",
+        description="A plain notebook",
+        unit_price=4.5,
+        in_stock=True,
+        number_in_stock=number_in_stock,
+        product_owner_id=owner.user_id,
+    )
+    return await product.save(db=session, created=True)
+
+
+@pytest.fixture
+async def last_item(engine):
+    """
+    Commits a product with one item left, deleting it afterwards.
+
+    Orders placed at the same time need their own connections, which can't
+    see the rows of a test's rolled back transaction.
+    """
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        seller = await create_user(db, username="last_item_seller")
+        buyer = await create_user(db, username="last_item_buyer")
+        product = await create_product(db, owner=seller, number_in_stock=1)
+        await db.commit()
+
+    yield product, buyer
+
+    async with AsyncSession(engine) as db:
+        await db.exec(
+            sa.delete(models.Order).where(
+                models.Order.product_id == product.product_id
+            )
+        )
+        await db.exec(
+            sa.delete(models.Product).where(
+                models.Product.product_id == product.product_id
+            )
+        )
+        await db.exec(
+            sa.delete(models.User).where(
+                models.User.user_id.in_([seller.user_id, buyer.user_id])
+            )
+        )
+        await db.commit()
+
+
+async def place_order(engine, *, product_id: UUID, user_id: UUID) -> bool:
+    """Orders one item in a session of its own, returning if it succeeded."""
+    order = schemas.OrderCreate(
+        orders=[schemas.OrderProductCreate(product_id=product_id, quantity=1)]
+    )
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        try:
+            await crud_order.create(db=db, order=order, user_id=user_id)
+            await db.commit()
+        # SQLite reports the locked database instead of waiting for it
+        except (HTTPException, sa.exc.OperationalError):
+            await db.rollback()
+            return False
+
+    return True
+
+
+async def test_concurrent_orders_do_not_oversell(engine, last_item):
+    product, buyer = last_item
+
+    placed = await asyncio.gather(
+        *(
+            place_order(
+                engine, product_id=product.product_id, user_id=buyer.user_id
+            )
+            for _ in range(3)
+        )
+    )
+    assert placed.count(True) == 1
+
+    async with AsyncSession(engine) as db:
+        db_product = await db.get(models.Product, product.product_id)
+        orders = await db.exec(
+            select(models.Order).where(
+                models.Order.product_id == product.product_id
+            )
+        )
+        assert len(orders.all()) == 1
+
+    assert db_product.number_in_stock == 0
+    assert db_product.in_stock is False
+
+
+async def test_update_product_stock_rejects_stock_taken_meanwhile(
+    session: AsyncSession, create_jdoe_user: models.User
+):
+    product = await create_product(
+        session, owner=create_jdoe_user, number_in_stock=1
+    )
+    await crud_order.update_product_stock(
+        product_id=product.product_id, quantity=1, db=session
+    )
+
+    # the second order passed its check before the first took the item
+    with pytest.raises(HTTPException) as error:
+        await crud_order.update_product_stock(
+            product_id=product.product_id, quantity=1, db=session
+        )
+    assert error.value.status_code == status.HTTP_409_CONFLICT
+
+
+async def test_get_orders_pages_with_next_cursor(
+    api_client: AsyncClient,
+    session: AsyncSession,
+    create_jdoe_user: models.User,
+    jdoe_headers: dict[str, str],
+):
+    product = await create_product(
+        session, owner=create_jdoe_user, number_in_stock=10
+    )
+    order_ids = []
+    for _ in range(3):
+        response = await api_client.post(
+            "/api/v1/orders",
+            json={
+                "orders": [
+                    {"product_id": str(product.product_id), "quantity": 1}
+                ]
+            },
+            headers=jdoe_headers,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        order_ids.append(response.json()["data"]["order_id"])
+
+    response = await api_client.get(
+        "/api/v1/orders", params={"limit": 2}, headers=jdoe_headers
+    )
+    first_page = response.json()
+    assert len(first_page["data"]) == 2
+    assert first_page["next_cursor"] == first_page["data"][-1]["order_id"]
+
+    response = await api_client.get(
+        "/api/v1/orders",
+        params={"limit": 2, "after": first_page["next_cursor"]},
+        headers=jdoe_headers,
+    )
+    second_page = response.json()
+    assert len(second_page["data"]) == 1
+    assert second_page["next_cursor"] is None
+
+    # newest first, each order exactly once across the pages
+    paged_ids = [
+        order["order_id"] for order in first_page["data"] + second_page["data"]
+    ]
+    assert paged_ids == order_ids[::-1]
@@ -0,0 +1,205 @@
+import os
+
+import pytest
+from fastapi import HTTPException, status
+from httpx import AsyncClient
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import utils
+from app.core.settings import settings
+from app.crud.products import crud_product
+from tests.conftest import create_user, get_auth_headers
+
+pytestmark = pytest.mark.anyio
+
+PRODUCT_FORM = {
+    "name": "Notebook",
+    "description": "A plain notebook",
+    "unit_price": "4.5",
+    "in_stock": "true",
+    "number_in_stock": "10",
+}
+
+
+@pytest.fixture(autouse=True)
+def upload_folder(tmp_path, monkeypatch):
+    """Saves the images uploaded by a test in its temporary folder."""
+    monkeypatch.setattr(utils, "UPLOAD_FOLDER", str(tmp_path))
+    return tmp_path
+
+
+async def upload_image(
+    api_client: AsyncClient, headers: dict[str, str]
+) -> str:
+    """Uploads an image as the raw request body, returning its path."""
+    response = await api_client.put(
+        "/api/v1/products/images/photo.png",
+        content=b"not really a png",
+        headers={**headers, "Content-Type": "image/png"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["data"]["file_path"]
+
+
+async def test_create_product_with_uploaded_image(
+    api_client: AsyncClient, jdoe_headers: dict[str, str]
+):
+    file_path = await upload_image(api_client, jdoe_headers)
+
+    response = await api_client.post(
+        "/api/v1/products",
+        data={**PRODUCT_FORM, "image_paths": [file_path]},
+        headers=jdoe_headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    images = response.json()["data"]["images"]
+    assert [image["file_path"] for image in images] == [file_path]
+
+
+async def test_create_product_rejects_image_of_another_user(
+    api_client: AsyncClient,
+    session: AsyncSession,
+    jdoe_headers: dict[str, str],
+):
+    jane = await create_user(session, username="jane")
+    file_path = await upload_image(api_client, get_auth_headers(jane))
+
+    response = await api_client.post(
+        "/api/v1/products",
+        data={**PRODUCT_FORM, "image_paths": [file_path]},
+        headers=jdoe_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == (
+        "Only paths of images you uploaded can be used."
+    )
+
+
+@pytest.mark.parametrize(
+    "file_path", ["app/main.py", "{folder}/../../app/main.py", "{folder}"]
+)
+async def test_create_product_rejects_paths_outside_uploads(
+    api_client: AsyncClient,
+    create_jdoe_user,
+    jdoe_headers: dict[str, str],
+    file_path: str,
+):
+    folder = utils.get_upload_folder(create_jdoe_user.user_id)
+    file_path = file_path.format(folder=folder)
+
+    response = await api_client.post(
+        "/api/v1/products",
+        data={**PRODUCT_FORM, "image_paths": [file_path]},
+        headers=jdoe_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_create_product_rejects_image_of_another_product(
+    api_client: AsyncClient, jdoe_headers: dict[str, str]
+):
+    file_path = await upload_image(api_client, jdoe_headers)
+    form = {**PRODUCT_FORM, "image_paths": [file_path]}
+
+    response = await api_client.post(
+        "/api/v1/products", data=form, headers=jdoe_headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await api_client.post(
+        "/api/v1/products", data=form, headers=jdoe_headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == (
+        "An uploaded image can only be used by one product."
+    )
+
+
+async def test_failed_create_product_removes_saved_images(
+    api_client: AsyncClient,
+    create_jdoe_user,
+    jdoe_headers: dict[str, str],
+    monkeypatch,
+):
+    async def create(**kwargs):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+
+    monkeypatch.setattr(crud_product, "create", create)
+
+    response = await api_client.post(
+        "/api/v1/products",
+        data=PRODUCT_FORM,
+        files={"images": ("photo.png", b"not really a png", "image/png")},
+        headers=jdoe_headers,
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    folder = utils.get_upload_folder(create_jdoe_user.user_id)
+    assert not os.listdir(folder)
+
+
+async def test_product_changes_clear_cached_product(
+    api_client: AsyncClient, jdoe_headers: dict[str, str]
+):
+    file_path = await upload_image(api_client, jdoe_headers)
+    response = await api_client.post(
+        "/api/v1/products",
+        data={**PRODUCT_FORM, "image_paths": [file_path]},
+        headers=jdoe_headers,
+    )
+    product_url = f"/api/v1/products/{response.json()['data']['product_id']}"
+
+    response = await api_client.get(product_url, headers=jdoe_headers)
+    assert response.json()["data"]["name"] == "Notebook"
+
+    response = await api_client.put(
+        product_url, data={"name": "Diary"}, headers=jdoe_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await api_client.get(product_url, headers=jdoe_headers)
+    assert response.json()["data"]["name"] == "Diary"
+
+    response = await api_client.delete(product_url, headers=jdoe_headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = await api_client.get(product_url, headers=jdoe_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_upload_image_rejects_other_content_types(
+    api_client: AsyncClient, jdoe_headers: dict[str, str]
+):
+    response = await api_client.put(
+        "/api/v1/products/images/script.html",
+        content=b"<script></script>",
+        headers={**jdoe_headers, "Content-Type": "text/html"},
+    )
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+async def test_upload_image_removes_images_too_large(
+    api_client: AsyncClient,
+    create_jdoe_user,
+    jdoe_headers: dict[str, str],
+    monkeypatch,
+):
+    # the settings are frozen, so the module reading the limit gets a copy
+    monkeypatch.setattr(
+        utils, "settings", settings.model_copy(update={"max_image_size": 8})
+    )
+
+    async def chunks():
+        # streamed without a Content-Length, so it is checked while saving
+        for _ in range(4):
+            yield b"1234"
+
+    response = await api_client.put(
+        "/api/v1/products/images/photo.png",
+        content=chunks(),
+        headers={**jdoe_headers, "Content-Type": "image/png"},
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    folder = utils.get_upload_folder(create_jdoe_user.user_id)
+    assert not os.listdir(folder)
@@ -0,0 +1,82 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import security
+from app.db import models
+from tests.conftest import create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_update_current_user_forgets_cached_user(
+    api_client: AsyncClient,
+    create_jdoe_user: models.User,
+    jdoe_headers: dict[str, str],
+):
+    response = await api_client.get("/api/v1/users/me", headers=jdoe_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert create_jdoe_user.user_id in security.current_user_cache
+
+    response = await api_client.put(
+        "/api/v1/users/me", json={"username": "jdoe2"}, headers=jdoe_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert create_jdoe_user.user_id not in security.current_user_cache
+
+    response = await api_client.get("/api/v1/users/me", headers=jdoe_headers)
+    assert response.json()["data"]["username"] == "jdoe2"
+
+
+async def test_delete_current_user_forgets_cached_user(
+    api_client: AsyncClient,
+    create_jdoe_user: models.User,
+    jdoe_headers: dict[str, str],
+):
+    response = await api_client.get("/api/v1/users/me", headers=jdoe_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert create_jdoe_user.user_id in security.current_user_cache
+
+    response = await api_client.delete(
+        "/api/v1/users/me", headers=jdoe_headers
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert create_jdoe_user.user_id not in security.current_user_cache
+
+    # the deleted user can't authenticate from a stale cache entry
+    response = await api_client.get("/api/v1/users/me", headers=jdoe_headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_get_users_pages_with_next_cursor(
+    api_client: AsyncClient,
+    session: AsyncSession,
+    jdoe_headers: dict[str, str],
+):
+    for username in ("alice", "bob", "carol", "dave"):
+        await create_user(session, username=username, role="buyer")
+
+    response = await api_client.get(
+        "/api/v1/users", params={"limit": 3}, headers=jdoe_headers
+    )
+    first_page = response.json()
+    assert response.status_code == status.HTTP_200_OK
+    assert len(first_page["data"]) == 3
+    assert first_page["next_cursor"] == first_page["data"][-1]["user_id"]
+
+    response = await api_client.get(
+        "/api/v1/users",
+        params={"limit": 3, "after": first_page["next_cursor"]},
+        headers=jdoe_headers,
+    )
+    second_page = response.json()
+    assert response.status_code == status.HTTP_200_OK
+    assert len(second_page["data"]) == 2
+    assert second_page["next_cursor"] is None
+
+    # newest first, each user exactly once across the pages
+    usernames = [
+        user["username"] for user in first_page["data"] + second_page["data"]
+    ]
+    assert usernames == ["dave", "carol", "bob", "alice", "jdoe"]